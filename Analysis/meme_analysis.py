@@ -0,0 +1,154 @@
+# Loads the four meme tables and turns the long (meme_id, hours_elapsed, value) rows
+# into dense memes x hours matrices, so every analysis is a batched array operation
+
+import argparse
+import os
+import sqlite3
+import time
+import numpy as np
+import pandas as pd
+import meme_cache
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample Data")
+
+# Value column of each hourly table
+HOURLY_TABLES = {
+    "meme_score": "score",
+    "meme_comments": "num_comments",
+    "meme_status": "is_hot",
+}
+
+def load_tables(data_dir: str = SAMPLE_DATA_DIR):
+    tables = {"meme_info": pd.read_csv(os.path.join(data_dir, "meme_info.csv"),
+                                       parse_dates = ["creation_time"])}
+    for table_name, value_column in HOURLY_TABLES.items():
+        tables[table_name] = pd.read_csv(
+            os.path.join(data_dir, f"{table_name}.csv"),
+            dtype = {"meme_id": str, "hours_elapsed": np.int32, value_column: np.int64}
+        )
+    return tables
+
+# Loads the tables from a database file written by the collector's SQLite backend
+def load_database_tables(database_path: str):
+    connection = sqlite3.connect(f"file:{database_path}?mode=ro", uri = True)
+    try:
+        tables = {"meme_info": pd.read_sql_query("SELECT * FROM meme_info", connection,
+                                                 parse_dates = ["creation_time"])}
+        for table_name in HOURLY_TABLES:
+            tables[table_name] = pd.read_sql_query(f"SELECT * FROM {table_name}", connection)
+        return tables
+    finally:
+        connection.close()
+
+# Scatters long rows into a (num_memes, num_hours) matrix, hours without data are NaN
+def pivot_hours(table: pd.DataFrame, value_column: str, meme_ids: pd.Index, num_hours: int):
+    rows = meme_ids.get_indexer(table["meme_id"])
+    hours = table["hours_elapsed"].to_numpy()
+    valid = (rows >= 0) & (hours < num_hours)
+    matrix = np.full((len(meme_ids), num_hours), np.nan)
+    matrix[rows[valid], hours[valid]] = table[value_column].to_numpy()[valid]
+    return matrix
+
+# Same as pivot_hours, for rows whose memes are already encoded as row numbers
+def pivot_codes(codes: np.ndarray, hours: np.ndarray, values: np.ndarray, num_memes: int, num_hours: int):
+    matrix = np.full((num_memes, num_hours), np.nan)
+    matrix[codes, hours] = values
+    return matrix
+
+class MemeTimeSeries:
+
+    def __init__(self, meme_ids: pd.Index, entered_hot: np.ndarray,
+                 score: np.ndarray, comments: np.ndarray, status: np.ndarray):
+        self.meme_ids = meme_ids
+        self.entered_hot = entered_hot
+        self.score = score
+        self.comments = comments
+        self.status = status
+
+    @classmethod
+    def from_tables(cls, tables: dict):
+        info = tables["meme_info"]
+        meme_ids = pd.Index(info["meme_id"])
+        num_hours = 1 + max(int(tables[table_name]["hours_elapsed"].max()) for table_name in HOURLY_TABLES)
+        matrices = [pivot_hours(tables[table_name], value_column, meme_ids, num_hours)
+                    for table_name, value_column in HOURLY_TABLES.items()]
+        return cls(meme_ids, info["entered_hot"].to_numpy().astype(bool), *matrices)
+
+    # Rows follow the cache's meme_id dictionary, so no string matching is needed
+    @classmethod
+    def from_cache(cls, cache: meme_cache.MemeCache):
+        meme_ids = pd.Index(cache.meme_ids.astype(str))
+        info = cache.info()
+        entered_hot = np.zeros(len(meme_ids), dtype = bool)
+        entered_hot[info["meme"]] = info["entered_hot"].astype(bool)
+        tables = {table_name: cache.hourly(table_name) for table_name in HOURLY_TABLES}
+        num_hours = 1 + max((int(table["hours"].max()) for table in tables.values() if len(table["hours"])), default = 0)
+        matrices = [pivot_codes(table["meme"], table["hours"], table["value"], len(meme_ids), num_hours)
+                    for table in tables.values()]
+        return cls(meme_ids, entered_hot, *matrices)
+
+    @property
+    def num_hours(self):
+        return self.score.shape[1]
+
+    # Hour by hour change of a memes x hours matrix, column h is the change from h to h + 1
+    def growth_curves(self, matrix: np.ndarray = None):
+        return np.diff(self.score if matrix is None else matrix, axis = 1)
+
+    # First hour each meme was seen in hot, -1 for memes that never were
+    def time_to_hot(self):
+        is_hot = self.status == 1
+        first_hot = is_hot.argmax(axis = 1)
+        return np.where(is_hot.any(axis = 1), first_hot, -1)
+
+    # Mean, median and number of observed memes per hour for the memes in "mask"
+    def trajectory(self, mask: np.ndarray, matrix: np.ndarray = None):
+        values = (self.score if matrix is None else matrix)[mask]
+        observed = ~np.isnan(values)
+        counts = observed.sum(axis = 0)
+        with np.errstate(invalid = "ignore", divide = "ignore"):
+            mean = np.nansum(values, axis = 0) / counts
+        median = np.full(values.shape[1], np.nan)
+        has_data = counts > 0
+        if has_data.any():
+            median[has_data] = np.nanmedian(values[:, has_data], axis = 0)
+        return pd.DataFrame({"mean": mean, "median": median, "memes": counts})
+
+    # Score trajectories of memes that entered hot against those that died in new
+    def hot_vs_new_trajectories(self, matrix: np.ndarray = None):
+        hot = self.entered_hot | (self.time_to_hot() >= 0)
+        return self.trajectory(hot, matrix), self.trajectory(~hot, matrix)
+
+# Loads through the binary cache by default, which is only (re)built when the CSVs change
+# With "database_path", the tables are read from the collector's SQLite database instead
+def load_time_series(data_dir: str = SAMPLE_DATA_DIR, use_cache: bool = True, database_path: str = None):
+    if database_path:
+        return MemeTimeSeries.from_tables(load_database_tables(database_path))
+    if use_cache:
+        return MemeTimeSeries.from_cache(meme_cache.open_cache(data_dir))
+    return MemeTimeSeries.from_tables(load_tables(data_dir))
+
+# Used by "python main.py analyze" as well
+def main(argv: list = None, prog: str = None):
+    parser = argparse.ArgumentParser(prog = prog, description = "Growth, time to hot and hot vs. new score trajectories")
+    parser.add_argument("--data-dir", default = SAMPLE_DATA_DIR, help = "directory of the CSV export")
+    parser.add_argument("--no-cache", action = "store_true", help = "parse the CSVs instead of using the binary cache")
+    parser.add_argument("--database", help = "SQLite database file of the collector, instead of the CSVs")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    series = load_time_series(args.data_dir, use_cache = not args.no_cache, database_path = args.database)
+    hours_to_hot = series.time_to_hot()
+    hot_trajectory, new_trajectory = series.hot_vs_new_trajectories()
+    elapsed = time.perf_counter() - start
+
+    print(f"{len(series.meme_ids)} memes over {series.num_hours} hours, analysed in {elapsed:.3f}s")
+    reached_hot = hours_to_hot[hours_to_hot >= 0]
+    print(f"{len(reached_hot)} memes reached hot, median time to hot: {np.median(reached_hot):.0f} hours")
+    print("Score trajectory of memes that entered hot:")
+    print(hot_trajectory.round(1).to_string())
+    print("Score trajectory of memes that died in new:")
+    print(new_trajectory.round(1).to_string())
+
+if __name__ == "__main__":
+    main()
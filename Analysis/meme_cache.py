@@ -0,0 +1,216 @@
+# Compact binary columnar cache of the four meme tables
+# Each column is a raw fixed-width array on disk, opened with np.memmap so analyses
+# start without parsing CSV and processes reading the same cache share pages.
+# meme_id strings are dictionary encoded: every table stores int32 codes into meme_ids.
+
+import hashlib
+import io
+import json
+import os
+import numpy as np
+import pandas as pd
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample Data")
+
+CACHE_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+
+# Bytes before the parsed offset that must be unchanged for a source to be extended
+SIGNATURE_BYTES = 4096
+
+ID_DTYPE = "S10"
+CODE_DTYPE = "int32"
+HOURS_DTYPE = "int16"
+
+# Value column and on-disk dtype of each hourly table
+HOURLY_COLUMNS = {
+    "meme_score": ("score", "int32"),
+    "meme_comments": ("num_comments", "int32"),
+    "meme_status": ("is_hot", "int8"),
+}
+
+TEXT_COLUMNS = ("title", "meme_url", "post_url")
+
+SOURCE_TABLES = ("meme_info",) + tuple(HOURLY_COLUMNS)
+
+class MemeCache:
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+        with open(os.path.join(cache_dir, MANIFEST_FILE), encoding = "utf-8") as f:
+            self.manifest = json.load(f)
+
+    # Memory-mapped, read-only view of one column
+    def column(self, name: str):
+        spec = self.manifest["columns"][name]
+        if spec["length"] == 0:
+            return np.empty(0, dtype = spec["dtype"])
+        return np.memmap(os.path.join(self.cache_dir, f"{name}.bin"), dtype = spec["dtype"],
+                         mode = "r", shape = (spec["length"],))
+
+    @property
+    def meme_ids(self):
+        return self.column("meme_ids")
+
+    # Columns of meme_info: meme codes, creation_time (unix seconds) and entered_hot
+    def info(self):
+        return {name: self.column(f"meme_info.{name}") for name in ("meme", "creation_time", "entered_hot")}
+
+    # Columns of an hourly table: meme codes, hours_elapsed and the value column
+    def hourly(self, table_name: str):
+        return {name: self.column(f"{table_name}.{name}") for name in ("meme", "hours", "value")}
+
+    # Decodes one text column of meme_info, titles are only materialized when asked for
+    def text(self, name: str):
+        blob = self.column(f"meme_info.{name}").tobytes()
+        ends = self.column(f"meme_info.{name}_ends")
+        starts = np.concatenate(([0], ends[:-1]))
+        return [blob[start:end].decode("utf-8") for start, end in zip(starts, ends)]
+
+class CacheWriter:
+
+    def __init__(self, data_dir: str, cache_dir: str):
+        self.data_dir = data_dir
+        self.cache_dir = cache_dir
+        self.manifest = self.__load_manifest()
+        self.meme_ids = pd.Index(self.__read_column("meme_ids").astype(str))
+
+    def __load_manifest(self):
+        path = os.path.join(self.cache_dir, MANIFEST_FILE)
+        if os.path.exists(path):
+            with open(path, encoding = "utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("version") == CACHE_VERSION:
+                return manifest
+        return {"version": CACHE_VERSION, "sources": dict(), "columns": dict()}
+
+    def __read_column(self, name: str):
+        spec = self.manifest["columns"].get(name)
+        if spec is None or spec["length"] == 0:
+            return np.empty(0, dtype = ID_DTYPE if name == "meme_ids" else "int64")
+        return np.fromfile(os.path.join(self.cache_dir, f"{name}.bin"), dtype = spec["dtype"],
+                           count = spec["length"])
+
+    # Bytes past the length in the manifest were appended by an update that stopped before
+    # writing its manifest, they are cut off so new values follow the counted ones
+    def __append_column(self, name: str, values: np.ndarray, dtype: str):
+        values = np.ascontiguousarray(values, dtype = dtype)
+        spec = self.manifest["columns"].setdefault(name, {"dtype": dtype, "length": 0})
+        with open(os.path.join(self.cache_dir, f"{name}.bin"), "ab") as f:
+            f.truncate(spec["length"] * np.dtype(dtype).itemsize)
+            f.write(values.tobytes())
+        spec["length"] += len(values)
+
+    def __signature(self, path: str, offset: int):
+        with open(path, "rb") as f:
+            f.seek(max(offset - SIGNATURE_BYTES, 0))
+            return hashlib.sha1(f.read(min(offset, SIGNATURE_BYTES))).hexdigest()
+
+    # Returns the complete lines appended to a source since the last update as a DataFrame,
+    # or None when the source is unchanged. Raises ValueError if the source was rewritten.
+    def __read_new_rows(self, table_name: str):
+        path = os.path.join(self.data_dir, f"{table_name}.csv")
+        state = self.manifest["sources"].get(table_name)
+        size = os.path.getsize(path)
+        if state is not None:
+            if size < state["offset"] or self.__signature(path, state["offset"]) != state["signature"]:
+                raise ValueError(f"{table_name}.csv was rewritten")
+            if size == state["offset"]:
+                return
+
+        with open(path, "rb") as f:
+            header = f.readline()
+            offset = state["offset"] if state is not None else f.tell()
+            f.seek(offset)
+            data = f.read()
+        # Stop at the last complete line, a partially written row is picked up next time
+        data = data[:data.rfind(b"\n") + 1]
+        columns = header.decode("utf-8-sig").strip().split(",")
+        self.manifest["sources"][table_name] = {
+            "offset": offset + len(data),
+            "signature": self.__signature(path, offset + len(data)),
+        }
+        if not data:
+            return
+        return pd.read_csv(io.BytesIO(data), header = None, names = columns, dtype = {"meme_id": str})
+
+    # Dictionary codes of "ids", unseen ids are appended to the dictionary
+    def __encode(self, ids: pd.Series):
+        codes = self.meme_ids.get_indexer(ids)
+        unseen = pd.unique(ids[codes < 0])
+        if len(unseen):
+            self.__append_column("meme_ids", np.array(unseen, dtype = ID_DTYPE), ID_DTYPE)
+            self.meme_ids = self.meme_ids.append(pd.Index(unseen))
+            codes = self.meme_ids.get_indexer(ids)
+        return codes
+
+    def __append_info(self, rows: pd.DataFrame):
+        self.__append_column("meme_info.meme", self.__encode(rows["meme_id"]), CODE_DTYPE)
+        creation_time = pd.to_datetime(rows["creation_time"]).to_numpy().astype("datetime64[s]").astype("int64")
+        self.__append_column("meme_info.creation_time", creation_time, "int64")
+        self.__append_column("meme_info.entered_hot", rows["entered_hot"].to_numpy(), "int8")
+        for name in TEXT_COLUMNS:
+            encoded = [str(value).encode("utf-8") for value in rows[name].fillna("")]
+            previous_end = self.manifest["columns"].get(f"meme_info.{name}", {"length": 0})["length"]
+            ends = previous_end + np.cumsum([len(value) for value in encoded], dtype = "int64")
+            self.__append_column(f"meme_info.{name}", np.frombuffer(b"".join(encoded), dtype = "uint8"), "uint8")
+            self.__append_column(f"meme_info.{name}_ends", ends, "int64")
+
+    def __append_hourly(self, table_name: str, rows: pd.DataFrame):
+        value_column, value_dtype = HOURLY_COLUMNS[table_name]
+        self.__append_column(f"{table_name}.meme", self.__encode(rows["meme_id"]), CODE_DTYPE)
+        self.__append_column(f"{table_name}.hours", rows["hours_elapsed"].to_numpy(), HOURS_DTYPE)
+        self.__append_column(f"{table_name}.value", rows[value_column].to_numpy(), value_dtype)
+
+    # Parses only what was appended to each source since the last update
+    def update(self):
+        updated = False
+        for table_name in SOURCE_TABLES:
+            rows = self.__read_new_rows(table_name)
+            if rows is None:
+                continue
+            if table_name == "meme_info":
+                self.__append_info(rows)
+            else:
+                self.__append_hourly(table_name, rows)
+            updated = True
+        if updated or not os.path.exists(os.path.join(self.cache_dir, MANIFEST_FILE)):
+            self.__ensure_columns()
+            # Replaced in one step, a reader or a crash never sees a partial manifest
+            path = os.path.join(self.cache_dir, MANIFEST_FILE)
+            with open(f"{path}.tmp", "w", encoding = "utf-8") as f:
+                json.dump(self.manifest, f, indent = 4)
+            os.replace(f"{path}.tmp", path)
+
+    # Empty sources still get (empty) columns so readers find every column
+    def __ensure_columns(self):
+        names = {"meme_ids": ID_DTYPE, "meme_info.meme": CODE_DTYPE,
+                 "meme_info.creation_time": "int64", "meme_info.entered_hot": "int8"}
+        for name in TEXT_COLUMNS:
+            names[f"meme_info.{name}"] = "uint8"
+            names[f"meme_info.{name}_ends"] = "int64"
+        for table_name, (_, value_dtype) in HOURLY_COLUMNS.items():
+            names.update({f"{table_name}.meme": CODE_DTYPE, f"{table_name}.hours": HOURS_DTYPE,
+                          f"{table_name}.value": value_dtype})
+        for name, dtype in names.items():
+            if name not in self.manifest["columns"]:
+                self.__append_column(name, np.empty(0), dtype)
+
+def clear_cache(cache_dir: str):
+    if not os.path.isdir(cache_dir):
+        return
+    for file_name in os.listdir(cache_dir):
+        if file_name == MANIFEST_FILE or file_name.endswith(".bin"):
+            os.remove(os.path.join(cache_dir, file_name))
+
+# Brings the cache in "cache_dir" up to date with the CSVs in "data_dir" and opens it
+# Sources that only grew are appended to, a rewritten source rebuilds the whole cache
+def open_cache(data_dir: str = SAMPLE_DATA_DIR, cache_dir: str = None):
+    cache_dir = cache_dir or os.path.join(data_dir, ".meme_cache")
+    os.makedirs(cache_dir, exist_ok = True)
+    try:
+        CacheWriter(data_dir, cache_dir).update()
+    except ValueError:
+        clear_cache(cache_dir)
+        CacheWriter(data_dir, cache_dir).update()
+    return MemeCache(cache_dir)
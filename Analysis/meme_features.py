@@ -0,0 +1,292 @@
+# Per-meme features from meme_info, for modeling which memes reach hot
+# Titles and urls are streamed in chunks from the CSV export or a collector database,
+# featurized on a process pool and checkpointed chunk by chunk, so an interrupted
+# run picks up where it stopped and a grown source only costs its new chunks.
+#
+# Features of each meme:
+#   title statistics   dense float32 matrix, columns in STAT_COLUMNS
+#   title n-grams      word 1- and 2-grams hashed (crc32) into NUM_HASH_FEATURES counts, stored as CSR
+#   media type         code into MEDIA_TYPES, parsed from meme_url
+#   domain             code into the domain dictionary of the manifest
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlsplit
+import numpy as np
+import pandas as pd
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Sample Data")
+
+FEATURES_VERSION = 2
+MANIFEST_FILE = "manifest.json"
+CHUNK_SIZE = 20000
+NUM_HASH_FEATURES = 2 ** 18
+
+STAT_COLUMNS = ("num_chars", "num_words", "mean_word_length", "upper_ratio",
+                "num_digits", "num_non_ascii", "has_question", "has_exclamation")
+
+MEDIA_TYPES = ("image", "gif", "video", "gallery", "text", "link")
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+GIF_EXTENSIONS = (".gif", ".gifv")
+VIDEO_EXTENSIONS = (".mp4", ".webm", ".mov")
+VIDEO_DOMAINS = ("v.redd.it", "youtube.com", "youtu.be", "streamable.com")
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+
+def title_stats(title: str, tokens: list):
+    num_chars = len(title)
+    num_letters = sum(char.isalpha() for char in title)
+    return (num_chars,
+            len(tokens),
+            sum(len(token) for token in tokens) / len(tokens) if tokens else 0,
+            sum(char.isupper() for char in title) / num_letters if num_letters else 0,
+            sum(char.isdigit() for char in title),
+            sum(not char.isascii() for char in title),
+            "?" in title,
+            "!" in title)
+
+# Hashed counts of the word 1- and 2-grams of a title, as (sorted feature indices, counts)
+def hashed_ngrams(tokens: list):
+    grams = tokens + [f"{first} {second}" for first, second in zip(tokens, tokens[1:])]
+    if not grams:
+        return np.empty(0, dtype = "int32"), np.empty(0, dtype = "uint16")
+    hashes = np.fromiter((zlib.crc32(gram.encode("utf-8")) % NUM_HASH_FEATURES for gram in grams),
+                         dtype = "int32", count = len(grams))
+    indices, counts = np.unique(hashes, return_counts = True)
+    return indices, counts.astype("uint16")
+
+# (media type code, domain) of a meme_url
+def parse_media(meme_url: str):
+    parts = urlsplit(meme_url)
+    domain = parts.netloc.lower()
+    domain = domain[4:] if domain.startswith("www.") else domain
+    extension = os.path.splitext(parts.path)[1].lower()
+    if domain in VIDEO_DOMAINS or extension in VIDEO_EXTENSIONS:
+        media_type = "video"
+    elif extension in GIF_EXTENSIONS:
+        media_type = "gif"
+    elif extension in IMAGE_EXTENSIONS or domain == "i.redd.it":
+        media_type = "image"
+    elif "/gallery/" in parts.path:
+        media_type = "gallery"
+    elif domain.endswith("reddit.com") and "/comments/" in parts.path:
+        media_type = "text"
+    else:
+        media_type = "link"
+    return MEDIA_TYPES.index(media_type), domain
+
+# Runs on a pool process: features of one chunk of (meme_id, title, meme_url) rows
+def featurize_chunk(chunk_index: int, meme_ids: list, titles: list, meme_urls: list):
+    stats = np.empty((len(meme_ids), len(STAT_COLUMNS)), dtype = "float32")
+    indptr = np.zeros(len(meme_ids) + 1, dtype = "int64")
+    indices, counts = [], []
+    media_types = np.empty(len(meme_ids), dtype = "int8")
+    domains = []
+    for row, (title, meme_url) in enumerate(zip(titles, meme_urls)):
+        tokens = TOKEN_PATTERN.findall(title.lower())
+        stats[row] = title_stats(title, tokens)
+        gram_indices, gram_counts = hashed_ngrams(tokens)
+        indices.append(gram_indices)
+        counts.append(gram_counts)
+        indptr[row + 1] = indptr[row] + len(gram_indices)
+        media_types[row], domain = parse_media(meme_url)
+        domains.append(domain)
+    return {
+        "chunk_index": chunk_index,
+        "meme_ids": np.array(meme_ids, dtype = "S10"),
+        "stats": stats,
+        "ngram_indptr": indptr,
+        "ngram_indices": np.concatenate(indices) if indices else np.empty(0, dtype = "int32"),
+        "ngram_counts": np.concatenate(counts) if counts else np.empty(0, dtype = "uint16"),
+        "media_types": media_types,
+        "domains": domains,
+    }
+
+# Content signature of a chunk's (meme_id, title, meme_url) rows, checkpointed with its features
+def chunk_signature(chunk: pd.DataFrame):
+    hashes = pd.util.hash_pandas_object(chunk[["meme_id", "title", "meme_url"]], index = False)
+    return hashlib.sha1(hashes.to_numpy().tobytes()).hexdigest()
+
+# Chunks of (meme_id, title, meme_url) rows in a stable order, so chunk i always holds the same memes
+def iter_csv_chunks(data_dir: str = SAMPLE_DATA_DIR, chunk_size: int = CHUNK_SIZE):
+    yield from pd.read_csv(os.path.join(data_dir, "meme_info.csv"), usecols = ["meme_id", "title", "meme_url"],
+                           dtype = str, keep_default_na = False, chunksize = chunk_size)
+
+# Same, from a database file written by the collector's SQLite backend, in insertion order
+def iter_database_chunks(database_path: str, chunk_size: int = CHUNK_SIZE):
+    connection = sqlite3.connect(f"file:{database_path}?mode=ro", uri = True)
+    try:
+        yield from pd.read_sql_query("SELECT meme_id, title, meme_url FROM meme_info ORDER BY rowid",
+                                     connection, chunksize = chunk_size)
+    finally:
+        connection.close()
+
+class MemeFeatures:
+
+    def __init__(self, feature_dir: str):
+        with open(os.path.join(feature_dir, MANIFEST_FILE), encoding = "utf-8") as f:
+            self.manifest = json.load(f)
+        chunks = [np.load(os.path.join(feature_dir, f"chunk_{chunk_index:05d}.npz"))
+                  for chunk_index in range(len(self.manifest["chunks"]))]
+        self.meme_ids = pd.Index(np.concatenate([chunk["meme_ids"] for chunk in chunks]).astype(str)
+                                 if chunks else [], dtype = object)
+        self.stats = (np.concatenate([chunk["stats"] for chunk in chunks]) if chunks
+                      else np.empty((0, len(STAT_COLUMNS)), dtype = "float32"))
+        self.media_types = np.concatenate([chunk["media_types"] for chunk in chunks]) if chunks else np.empty(0, "int8")
+        self.domain_codes = np.concatenate([chunk["domains"] for chunk in chunks]) if chunks else np.empty(0, "int32")
+        self.domains = self.manifest["domains"]
+
+        # Hashed n-gram counts as one CSR matrix: row r has columns ngram_indices[indptr[r]:indptr[r + 1]]
+        offsets = np.cumsum([0] + [chunk["ngram_indices"].shape[0] for chunk in chunks])
+        self.ngram_indptr = np.concatenate([[0]] + [chunk["ngram_indptr"][1:] + offset
+                                                    for chunk, offset in zip(chunks, offsets)]).astype("int64")
+        self.ngram_indices = np.concatenate([chunk["ngram_indices"] for chunk in chunks]) if chunks else np.empty(0, "int32")
+        self.ngram_counts = np.concatenate([chunk["ngram_counts"] for chunk in chunks]) if chunks else np.empty(0, "uint16")
+
+    def __len__(self):
+        return len(self.meme_ids)
+
+    # Title statistics, media type and domain as a DataFrame indexed by meme_id
+    def to_frame(self):
+        frame = pd.DataFrame(self.stats, index = self.meme_ids, columns = STAT_COLUMNS)
+        frame["media_type"] = pd.Categorical.from_codes(self.media_types, MEDIA_TYPES)
+        frame["domain"] = pd.Categorical.from_codes(self.domain_codes, self.domains)
+        return frame
+
+    # Row of each meme in "meme_ids" (e.g. MemeTimeSeries.meme_ids), -1 for memes without features
+    def rows_for(self, meme_ids: pd.Index):
+        return self.meme_ids.get_indexer(meme_ids)
+
+    # Dense n-gram counts of some rows, the full matrix is too large to materialize
+    def ngram_rows(self, rows: np.ndarray):
+        matrix = np.zeros((len(rows), NUM_HASH_FEATURES), dtype = "float32")
+        for i, row in enumerate(rows):
+            start, end = self.ngram_indptr[row], self.ngram_indptr[row + 1]
+            matrix[i, self.ngram_indices[start:end]] = self.ngram_counts[start:end]
+        return matrix
+
+class FeatureWriter:
+
+    def __init__(self, feature_dir: str, source: str, chunk_size: int):
+        self.feature_dir = feature_dir
+        self.manifest = self.__load_manifest(source, chunk_size)
+        self.domain_codes = {domain: code for code, domain in enumerate(self.manifest["domains"])}
+
+    def __load_manifest(self, source: str, chunk_size: int):
+        path = os.path.join(self.feature_dir, MANIFEST_FILE)
+        if os.path.exists(path):
+            with open(path, encoding = "utf-8") as f:
+                manifest = json.load(f)
+            if (manifest.get("version") == FEATURES_VERSION and manifest.get("source") == source
+                    and manifest.get("chunk_size") == chunk_size
+                    and manifest.get("num_hash_features") == NUM_HASH_FEATURES):
+                return manifest
+        return {"version": FEATURES_VERSION, "source": source, "chunk_size": chunk_size,
+                "num_hash_features": NUM_HASH_FEATURES, "domains": [], "chunks": []}
+
+    # A chunk is done once it was written with the same content, so a chunk of a rewritten source
+    # is redone even if its row count is unchanged, and the last chunk is redone while the source grows
+    def is_done(self, chunk_index: int, signature: str):
+        chunks = self.manifest["chunks"]
+        return chunk_index < len(chunks) and chunks[chunk_index] == signature
+
+    # Writes one featurized chunk and checkpoints it in the manifest with the signature of its rows
+    def write(self, result: dict, signature: str):
+        domains = np.empty(len(result["domains"]), dtype = "int32")
+        for row, domain in enumerate(result["domains"]):
+            if domain not in self.domain_codes:
+                self.domain_codes[domain] = len(self.manifest["domains"])
+                self.manifest["domains"].append(domain)
+            domains[row] = self.domain_codes[domain]
+        arrays = {key: value for key, value in result.items() if key not in ("chunk_index", "domains")}
+        chunk_index = result["chunk_index"]
+        path = os.path.join(self.feature_dir, f"chunk_{chunk_index:05d}.npz")
+        np.savez(path + ".tmp.npz", domains = domains, **arrays)
+        os.replace(path + ".tmp.npz", path)
+
+        chunks = self.manifest["chunks"]
+        chunks.extend([None] * (chunk_index + 1 - len(chunks)))
+        chunks[chunk_index] = signature
+        self.save()
+
+    # Rewritten after every chunk, so an interrupted run only loses the chunks in flight
+    def save(self):
+        path = os.path.join(self.feature_dir, MANIFEST_FILE)
+        with open(path + ".tmp", "w", encoding = "utf-8") as f:
+            json.dump(self.manifest, f)
+        os.replace(path + ".tmp", path)
+
+    def finish(self, num_chunks: int):
+        del self.manifest["chunks"][num_chunks:]
+        self.save()
+
+# Featurizes "chunks" on "workers" processes (default: all cores) into "feature_dir" and opens the result
+# Chunks checkpointed by an earlier run over the same source are skipped
+def extract_features(chunks, feature_dir: str, source: str, chunk_size: int = CHUNK_SIZE, workers: int = None):
+    os.makedirs(feature_dir, exist_ok = True)
+    writer = FeatureWriter(feature_dir, source, chunk_size)
+    workers = workers or os.cpu_count()
+    num_chunks = 0
+    with ProcessPoolExecutor(workers) as executor:
+        pending = dict()
+        for chunk_index, chunk in enumerate(chunks):
+            num_chunks += 1
+            signature = chunk_signature(chunk)
+            if writer.is_done(chunk_index, signature):
+                continue
+            future = executor.submit(featurize_chunk, chunk_index, chunk["meme_id"].tolist(),
+                                     chunk["title"].fillna("").tolist(), chunk["meme_url"].fillna("").tolist())
+            pending[future] = signature
+            # Only a few chunks are held in memory while the source is read
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when = FIRST_COMPLETED)
+                for future in done:
+                    writer.write(future.result(), pending.pop(future))
+        for future, signature in pending.items():
+            writer.write(future.result(), signature)
+    writer.finish(num_chunks)
+    return MemeFeatures(feature_dir)
+
+def features_from_csv(data_dir: str = SAMPLE_DATA_DIR, feature_dir: str = None,
+                      chunk_size: int = CHUNK_SIZE, workers: int = None):
+    feature_dir = feature_dir or os.path.join(data_dir, ".meme_features")
+    return extract_features(iter_csv_chunks(data_dir, chunk_size), feature_dir,
+                            os.path.abspath(os.path.join(data_dir, "meme_info.csv")), chunk_size, workers)
+
+def features_from_database(database_path: str, feature_dir: str = None,
+                           chunk_size: int = CHUNK_SIZE, workers: int = None):
+    feature_dir = feature_dir or os.path.join(os.path.dirname(os.path.abspath(database_path)), ".meme_features")
+    return extract_features(iter_database_chunks(database_path, chunk_size), feature_dir,
+                            os.path.abspath(database_path), chunk_size, workers)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Extract title and media features of every meme")
+    parser.add_argument("--data-dir", default = SAMPLE_DATA_DIR, help = "directory of the CSV export")
+    parser.add_argument("--database", help = "SQLite database file of the collector, instead of the CSVs")
+    parser.add_argument("--output", help = "feature directory (default: .meme_features next to the data)")
+    parser.add_argument("--chunk-size", type = int, default = CHUNK_SIZE)
+    parser.add_argument("--workers", type = int, default = None, help = "processes (default: all cores)")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.database:
+        features = features_from_database(args.database, args.output, args.chunk_size, args.workers)
+    else:
+        features = features_from_csv(args.data_dir, args.output, args.chunk_size, args.workers)
+    elapsed = time.perf_counter() - start
+
+    frame = features.to_frame()
+    print(f"Features of {len(features)} memes in {elapsed:.3f}s, "
+          f"{len(features.ngram_indices)} non-zero hashed n-gram counts")
+    print("Media types:")
+    print(frame["media_type"].value_counts().to_string())
+    print("Top domains:")
+    print(frame["domain"].value_counts().head(10).to_string())
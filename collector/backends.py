@@ -0,0 +1,303 @@
+# Storage backends behind DatabaseHelper
+# A backend owns connections and everything that differs between database engines,
+# DatabaseHelper runs the same four-table schema and statements on any of them.
+
+import os
+import sqlite3
+import sys
+import threading
+import time
+from config import USER_PARAMS
+
+class StorageBackend:
+    # Base class of database engine errors, and the subset that means the connection was lost
+    error = Exception
+    connection_errors = ()
+
+    def connect(self, database_name: str = None):
+        raise NotImplementedError
+
+    @property
+    def connected(self):
+        raise NotImplementedError
+
+    def database_exists(self, database_name: str):
+        raise NotImplementedError
+
+    def create_database(self, database_name: str):
+        raise NotImplementedError
+
+    # Names of the tables and views of the current database
+    def table_names(self):
+        raise NotImplementedError
+
+    # Names of the indexes of the current database
+    def index_names(self):
+        raise NotImplementedError
+
+    # Rewrites a query written with %s placeholders to the engine's paramstyle
+    def prepare(self, query: str):
+        return query
+
+    # INSERT that overwrites "update_columns" when a row with the same key already exists
+    # "update_columns" can also map columns to an expression merging the stored row with the new one,
+    # where "{column}" stands for the new value and a bare column name for the stored value.
+    # MySQL assigns left to right, so a column must come after every expression that reads it
+    def upsert_query(self, table_name: str, columns: tuple, key_columns: tuple, update_columns):
+        raise NotImplementedError
+
+    # SQL for the value "column" has in the row being upserted
+    def excluded(self, column: str):
+        raise NotImplementedError
+
+    # SQL for the DATETIME "column" plus "hours" (an integer expression) hours
+    def add_hours(self, column: str, hours):
+        raise NotImplementedError
+
+    def _assignments(self, columns: tuple, update_columns):
+        if not isinstance(update_columns, dict):
+            update_columns = {column: f"{{{column}}}" for column in update_columns}
+        new_values = {column: self.excluded(column) for column in columns}
+        return ", ".join(f"{column} = {expression.format(**new_values)}"
+                         for column, expression in update_columns.items())
+
+    def cursor(self, connection):
+        return connection.cursor()
+
+    # Cursor that runs "query" as a prepared statement, reused for later runs of the same query
+    def prepared_cursor(self, connection, query: str):
+        return connection.cursor()
+
+    # Runs work(connection) and returns its result
+    def run(self, work):
+        raise NotImplementedError
+
+class MySQLBackend(StorageBackend):
+
+    def __init__(self, host_name: str, user_name: str, user_password: str,
+                 pool_size: int = 4, max_retries: int = 5, retry_delay: float = 1):
+        # MySQL is only imported when the MySQL backend is used
+        try:
+            from mysql.connector import Error, InterfaceError, OperationalError, PoolError, pooling
+        except ImportError:
+            pooling = None
+        assert pooling is not None, "mysql-connector-python is required for the MySQL backend"
+        self.pooling = pooling
+        self.error = Error
+        self.connection_errors = (InterfaceError, OperationalError)
+        self.pool_error = PoolError
+        self.hostname = host_name
+        self.username = user_name
+        self.password = user_password
+        self.pool = None
+
+        # Prepared cursors of each pooled connection by query: {id: (session, {query: cursor})}
+        # Statements are prepared once per session instead of before every execution
+        self.prepared_cursors = dict()
+        self.prepared_lock = threading.Lock()
+
+        # Connection pool shared by every thread using this backend
+        # Lost connections are retried "max_retries" times, waiting retry_delay * 2^attempt
+        self.pool_size = pool_size
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+
+    # The pool is created once, switching databases reconfigures its connections
+    # as they are handed out next
+    def connect(self, database_name: str = None):
+        config = dict(host = self.hostname, user = self.username, passwd = self.password, database = database_name)
+        try:
+            if self.pool is None:
+                # Resetting the session on release would drop the prepared statements of a connection
+                self.pool = self.pooling.MySQLConnectionPool(pool_name = f"memes-{id(self)}",
+                                                             pool_size = self.pool_size,
+                                                             pool_reset_session = False, **config)
+            else:
+                self.pool.set_config(**config)
+                self.__get_connection().close()
+            print("Connection successful")
+            return True
+        except self.error as e:
+            print(f"Error: {e}")
+            return False
+
+    @property
+    def connected(self):
+        return self.pool is not None
+
+    def database_exists(self, database_name: str):
+        def work(connection):
+            cursor = connection.cursor()
+            cursor.execute("SHOW DATABASES;")
+            return [item[0] for item in cursor.fetchall()]
+        return database_name in (self.run(work) or [])
+
+    def create_database(self, database_name: str):
+        def work(connection):
+            try:
+                connection.cursor().execute(f"CREATE DATABASE {database_name}")
+            except self.connection_errors:
+                raise
+            except self.error as e:
+                print(f"Error: {e}")
+        self.run(work)
+
+    def table_names(self):
+        def work(connection):
+            cursor = connection.cursor()
+            cursor.execute("SHOW TABLES;")
+            return [item[0] for item in cursor.fetchall()]
+        return self.run(work) or []
+
+    def index_names(self):
+        def work(connection):
+            cursor = connection.cursor()
+            cursor.execute("SELECT DISTINCT index_name FROM information_schema.statistics WHERE table_schema = DATABASE();")
+            return [item[0] for item in cursor.fetchall()]
+        return self.run(work) or []
+
+    # A prepared cursor only skips preparing again when it is given the same string object,
+    # so equal queries (e.g. built by upsert_query) are interned
+    def prepare(self, query: str):
+        return sys.intern(query)
+
+    # The pool hands out the same connections in a new wrapper every time, so cursors are
+    # cached per underlying connection and dropped when it reconnects with a new session
+    def prepared_cursor(self, connection, query: str):
+        session = connection._cnx
+        with self.prepared_lock:
+            session_id, cursors = self.prepared_cursors.get(id(session), (None, None))
+            if cursors is None or session_id != session.connection_id:
+                cursors = dict()
+                self.prepared_cursors[id(session)] = (session.connection_id, cursors)
+        cursor = cursors.get(query)
+        if cursor is None:
+            cursor = cursors[query] = session.cursor(prepared = True)
+        return cursor
+
+    def upsert_query(self, table_name: str, columns: tuple, key_columns: tuple, update_columns):
+        return f"""
+    INSERT INTO {table_name} ({", ".join(columns)})
+    VALUES ({", ".join(["%s"] * len(columns))})
+    ON DUPLICATE KEY UPDATE {self._assignments(columns, update_columns)};
+    """
+
+    def excluded(self, column: str):
+        return f"VALUES({column})"
+
+    def add_hours(self, column: str, hours):
+        return f"TIMESTAMPADD(HOUR, {hours}, {column})"
+
+    # The pool pings a connection when it is handed out and reconnects it if it was dropped
+    def __get_connection(self):
+        while True:
+            try:
+                return self.pool.get_connection()
+            except self.pool_error:
+                # Every connection is in use by another thread
+                time.sleep(0.05)
+
+    # Runs work(connection) on a pooled connection, retrying with backoff when the connection is lost
+    def run(self, work):
+        assert self.pool, "No connection is established, connect to server/database first"
+        for attempt in range(self.max_retries + 1):
+            try:
+                connection = self.__get_connection()
+            except self.connection_errors as e:
+                error = e
+            else:
+                try:
+                    return work(connection)
+                except self.connection_errors as e:
+                    error = e
+                finally:
+                    connection.close()
+            if attempt < self.max_retries:
+                delay = self.retry_delay * 2 ** attempt
+                print(f"Error: {error}. Reconnecting in {delay}s")
+                time.sleep(delay)
+        print(f"Error: {error}. Giving up after {self.max_retries} retries")
+
+# Embedded backend: one SQLite file per database in "directory", no server process needed
+# WAL mode lets readers (e.g. an analysis job) work on the file while the collector writes
+class SQLiteBackend(StorageBackend):
+    error = sqlite3.Error
+
+    def __init__(self, directory: str = ".", busy_timeout: float = 30):
+        self.directory = directory
+        self.busy_timeout = busy_timeout
+        self.path = None
+        # sqlite3 connections can't be shared between threads, each thread gets its own
+        self.local = threading.local()
+
+    def database_path(self, database_name: str):
+        return os.path.join(self.directory, f"{database_name}.db")
+
+    # Connecting to the "server" only checks that the directory exists
+    def connect(self, database_name: str = None):
+        os.makedirs(self.directory, exist_ok = True)
+        self.path = self.database_path(database_name) if database_name else None
+        self.local = threading.local()
+        return True
+
+    @property
+    def connected(self):
+        return True
+
+    def database_exists(self, database_name: str):
+        return os.path.exists(self.database_path(database_name))
+
+    def create_database(self, database_name: str):
+        sqlite3.connect(self.database_path(database_name)).close()
+
+    def table_names(self):
+        def work(connection):
+            cursor = connection.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'view');")
+            return [item[0] for item in cursor.fetchall()]
+        return self.run(work)
+
+    def index_names(self):
+        def work(connection):
+            cursor = connection.execute("SELECT name FROM sqlite_master WHERE type = 'index';")
+            return [item[0] for item in cursor.fetchall()]
+        return self.run(work)
+
+    def prepare(self, query: str):
+        return query.replace("%s", "?")
+
+    def upsert_query(self, table_name: str, columns: tuple, key_columns: tuple, update_columns):
+        return f"""
+    INSERT INTO {table_name} ({", ".join(columns)})
+    VALUES ({", ".join(["%s"] * len(columns))})
+    ON CONFLICT ({", ".join(key_columns)}) DO UPDATE
+    SET {self._assignments(columns, update_columns)};
+    """
+
+    def excluded(self, column: str):
+        return f"excluded.{column}"
+
+    def add_hours(self, column: str, hours):
+        return f"datetime({column}, '+' || ({hours}) || ' hours')"
+
+    def __get_connection(self):
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            assert self.path, "Current database is not specified"
+            connection = sqlite3.connect(self.path, timeout = self.busy_timeout)
+            connection.execute("PRAGMA journal_mode = WAL;")
+            connection.execute("PRAGMA synchronous = NORMAL;")
+            connection.execute("PRAGMA foreign_keys = ON;")
+            self.local.connection = connection
+        return connection
+
+    # sqlite3 keeps a per-connection cache of prepared statements, so no prepared cursor is needed
+    def run(self, work):
+        return work(self.__get_connection())
+
+# Backend selected by the "storage" section of config.py, MySQL unless BACKEND is "sqlite"
+def configured_backend(pool_size: int = 4):
+    STORAGE = USER_PARAMS.get("storage", {})
+    if STORAGE.get("BACKEND", "mysql") == "sqlite":
+        return SQLiteBackend(STORAGE.get("SQLITE-DIRECTORY") or ".")
+    MYSQL = USER_PARAMS["mysql-db"]
+    return MySQLBackend(MYSQL["HOST-NAME"], MYSQL["USER-NAME"], MYSQL["USER-PASSWORD"], pool_size)
@@ -0,0 +1,154 @@
+# Offline benchmark: replays a recorded workload through MemeStatsScraper and DataCollector
+# against a local fake Reddit (fake_reddit.py) and an SQLite database, on a virtual clock,
+# so a full collection run takes seconds instead of days
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Callable
+from backends import SQLiteBackend
+from collector import DataCollector
+from config import USER_PARAMS
+from database import DatabaseHelper
+from fake_reddit import load_workload, FakeReddit
+from metrics import REGISTRY
+from scraper import MemeStatsScraper
+
+SAMPLE_DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                               "Analysis", "Sample Data")
+
+# Report keys compared against a baseline, and whether higher values are better
+COMPARED_RESULTS = {
+    "speedup": True,
+    "memes_tracked_per_hour": True,
+    "db_rows_per_second": True,
+    "mean_update_lag_seconds": False,
+    "peak_memory_mb": False,
+}
+
+# Sleeping skips ahead instantly, so waiting for the next task costs nothing,
+# while time spent working still passes as it does on a real clock (and shows up as update lag)
+# "drain" waits for work running beside the sleeping thread (the pipeline writers) before
+# skipping ahead, a backlog of writes then takes up time as it would on a real clock
+class VirtualClock:
+
+    def __init__(self, start: float, drain: Callable = None):
+        self.now = start
+        self.resumed_at = time.perf_counter()
+        self.drain = drain
+
+    def time(self):
+        return self.now + (time.perf_counter() - self.resumed_at)
+
+    def sleep(self, seconds: float):
+        wake_at = self.time() + max(seconds, 0)
+        if self.drain is not None:
+            self.drain()
+        self.now = max(self.time(), wake_at)
+        self.resumed_at = time.perf_counter()
+
+def run_benchmark(data_dir: str = SAMPLE_DATA_DIR, collect_new_hours: float = None,
+                  update_hours: int = 24, num_writers: int = 1, schema: str = "tables"):
+    memes = load_workload(data_dir)
+    clock = VirtualClock(memes[0].created + 60)
+    if collect_new_hours is None:
+        collect_new_hours = (memes[-1].created - memes[0].created) / 3600
+    reddit = FakeReddit(memes, clock.time)
+    # Results are read from the metrics registry, no snapshot file is needed
+    USER_PARAMS.setdefault("metrics", dict())["SNAPSHOT-FILE"] = ""
+
+    with tempfile.TemporaryDirectory() as database_dir:
+        dbhelper = DatabaseHelper(backend = SQLiteBackend(database_dir), schema = schema)
+        collector = DataCollector(num_writers, scraper = MemeStatsScraper(reddit = reddit, clock = clock.time),
+                                  dbhelper = dbhelper, clock = clock.time, sleep = clock.sleep)
+        collector.prepare_database("benchmark")
+        clock.drain = collector.pipeline.queue.join
+
+        start_time = clock.time()
+        tracemalloc.start()
+        wall_start = time.perf_counter()
+        collector.run(collect_new_hours, update_hours)
+        wall_seconds = time.perf_counter() - wall_start
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        # Updates per hour of observation time (creation time + hours_elapsed)
+        updates_per_hour = [count for _, count in dbhelper.execute_query("""
+            SELECT strftime('%Y-%m-%d %H', creation_time, '+' || hours_elapsed || ' hours') AS hour, COUNT(*)
+            FROM meme_score JOIN meme_info USING (meme_id)
+            WHERE hours_elapsed > 0
+            GROUP BY hour;
+            """, mode = "search")]
+
+    snapshot = REGISTRY.snapshot()
+    # Lag is measured when an update is written, so a backlog of writes shows up in it
+    lags = {series["labels"]["minute"]: series["value"] for series in snapshot["histograms"].get("update_write_lag_seconds", [])}
+    total_lag = sum(lag["sum"] for lag in lags.values())
+    lag_count = sum(lag["count"] for lag in lags.values())
+    start_lags = [series["value"] for series in snapshot["histograms"].get("update_bucket_lag_seconds", [])]
+    rows_written = sum(series["value"] for series in snapshot["counters"].get("db_rows_written_total", []))
+    virtual_seconds = clock.time() - start_time
+
+    return {
+        "virtual_hours": round(virtual_seconds / 3600, 2),
+        "wall_seconds": round(wall_seconds, 2),
+        "speedup": round(virtual_seconds / wall_seconds, 1),
+        "memes_in_workload": len(memes),
+        "memes_tracked_per_hour": round(sum(updates_per_hour) / max(len(updates_per_hour), 1), 1),
+        "max_memes_tracked_per_hour": max(updates_per_hour, default = 0),
+        "reddit_requests": reddit.total_requests,
+        "max_reddit_requests_per_hour": max(reddit.requests_per_hour.values(), default = 0),
+        "db_rows_written": rows_written,
+        "db_rows_per_second": round(rows_written / wall_seconds, 1),
+        "mean_update_lag_seconds": round(total_lag / lag_count, 4) if lag_count else 0,
+        "max_update_lag_seconds": round(max((lag["max"] for lag in lags.values()), default = 0), 4),
+        "max_update_start_lag_seconds": round(max((lag["max"] for lag in start_lags), default = 0), 4),
+        "max_write_queue_seconds": round(collector.pipeline.metrics["queued"].max_seconds, 4),
+        "update_lag_per_minute": {minute: {"mean": round(lag["sum"] / lag["count"], 4), "max": round(lag["max"], 4)}
+                                  for minute, lag in sorted(lags.items()) if lag["count"]},
+        "peak_memory_mb": round(peak_memory / 2 ** 20, 1),
+    }
+
+# Names of the results that are worse than the baseline by more than "tolerance" (relative)
+def find_regressions(results: dict, baseline: dict, tolerance: float = 0.2):
+    regressions = []
+    for key, higher_is_better in COMPARED_RESULTS.items():
+        if key not in baseline or not baseline[key]:
+            continue
+        change = (results[key] - baseline[key]) / abs(baseline[key])
+        if (-change if higher_is_better else change) > tolerance:
+            regressions.append(key)
+    return regressions
+
+# Used by "python main.py bench" as well
+def main(argv: list = None, prog: str = None):
+    parser = argparse.ArgumentParser(prog = prog, description = "Benchmark the collector against a recorded workload")
+    parser.add_argument("--data-dir", default = SAMPLE_DATA_DIR)
+    parser.add_argument("--collect-new-hours", type = float, default = None,
+                        help = "hours of new memes to collect (default: the whole workload)")
+    parser.add_argument("--update-hours", type = int, default = 24)
+    parser.add_argument("--writers", type = int, default = 1)
+    parser.add_argument("--schema", choices = ("tables", "snapshot"), default = "tables")
+    parser.add_argument("--output", help = "write the results as JSON to this file")
+    parser.add_argument("--baseline", help = "JSON results of an earlier run to compare against")
+    parser.add_argument("--tolerance", type = float, default = 0.2)
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.data_dir, args.collect_new_hours, args.update_hours, args.writers, args.schema)
+    print(json.dumps({key: value for key, value in results.items() if key != "update_lag_per_minute"}, indent = 4))
+    if args.output:
+        with open(args.output, "w", encoding = "utf-8") as f:
+            json.dump(results, f, indent = 4)
+    if args.baseline:
+        with open(args.baseline, encoding = "utf-8") as f:
+            regressions = find_regressions(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import time
+from typing import Callable
+
+# Small dict-backed cache whose entries expire "ttl" seconds after they are set
+class TTLCache:
+
+    def __init__(self, ttl: float, clock: Callable = time.monotonic):
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = dict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return False
+        if entry[1] <= self.clock():
+            del self.entries[key]
+            return False
+        return True
+
+    def get(self, key, default = None):
+        return self.entries[key][0] if key in self else default
+
+    def set(self, key, value):
+        self.entries[key] = (value, self.clock() + self.ttl)
+
+    # Drops every expired entry, so keys that are never looked up again don't pile up
+    def prune(self):
+        now = self.clock()
+        for key in [key for key, (_, expiry) in self.entries.items() if expiry <= now]:
+            del self.entries[key]
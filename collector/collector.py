@@ -1,48 +1,94 @@
 from scraper import MemeStatsScraper
 from database import DatabaseHelper
+from backends import configured_backend
 from config import USER_PARAMS
+from scheduler import AdaptiveScheduler, PRIORITY_UPDATE, PRIORITY_HOT, PRIORITY_NEW
+from pipeline import CollectionPipeline
+from cache import TTLCache
+from metrics import REGISTRY
+from sharding import ShardCoordinator
+from polling import PollingCadence
+from fetcher import DEFERRED
 import logging
-import schedule
+import threading
+import time as timer
+from typing import Callable
 from datetime import datetime, timedelta
 
-# logging related info
-logging.basicConfig(
-    filename = "worklog.log",
-    filemode = "w",
-    level = logging.INFO,
-    format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# logging related info, set up by whoever runs a collection rather than on import
+def configure_logging(filename: str = "worklog.log"):
+    logging.basicConfig(
+        filename = filename,
+        filemode = "w",
+        level = logging.INFO,
+        format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
 
-# Used for praw debugging
-for logger_name in ("scraper", "praw", "prawcore"):
-    logger = logging.getLogger(logger_name)
-    logger.setLevel(logging.DEBUG)
+    # Used for praw debugging
+    if USER_PARAMS.get("logging", {}).get("PRAW-DEBUG", False):
+        for logger_name in ("scraper", "praw", "prawcore"):
+            logger = logging.getLogger(logger_name)
+            logger.setLevel(logging.DEBUG)
 
 class DataCollector:
     
-    def __init__(self):
+    # scraper, dbhelper, clock and sleep can be injected, e.g. a fake Reddit and a virtual clock for benchmarks
+    # With "shard_id", this collector is one worker of a sharded run (see sharding.py)
+    def __init__(self, num_writers: int = 1, scraper: MemeStatsScraper = None, dbhelper: DatabaseHelper = None,
+                 clock: Callable = timer.time, sleep: Callable = timer.sleep, shard_id: str = None):
         # Find a way to encrypt/hide info later
         USER_AGENT = USER_PARAMS["reddit"]["USER-AGENT"]
         CLIENT_ID = USER_PARAMS["reddit"]["CLIENT-ID"]
         CLIENT_SECRET = USER_PARAMS["reddit"]["CLIENT-SECRET"]
-        HOST_NAME = USER_PARAMS["mysql-db"]["HOST-NAME"]
-        USER_NAME = USER_PARAMS["mysql-db"]["USER-NAME"]
-        USER_PASSWORD = USER_PARAMS["mysql-db"]["USER-PASSWORD"]
+        
+        SUBREDDITS = USER_PARAMS.get("collection", {}).get("SUBREDDITS") or ["memes"]
         
         # Scraper and Database Helper configurations
-        self.scraper = MemeStatsScraper(USER_AGENT, CLIENT_ID, CLIENT_SECRET)
-        self.dbhelper = DatabaseHelper(HOST_NAME, USER_NAME, USER_PASSWORD)
-        self.dbhelper.connect_server()
-        self.current_hot_ids = []
+        self.scraper = scraper or MemeStatsScraper(USER_AGENT, CLIENT_ID, CLIENT_SECRET, subreddits = SUBREDDITS,
+                                                   clock = clock)
+        SCHEMA = USER_PARAMS.get("storage", {}).get("SCHEMA", "tables")
+        # One connection each for the scheduler thread, the writers and the shard heartbeat
+        self.dbhelper = dbhelper or DatabaseHelper(backend = configured_backend(pool_size = num_writers + 2),
+                                                   schema = SCHEMA)
+        # Hot ids are collected per subreddit, current_hot_ids is the union of them
+        self.hot_ids_by_subreddit = dict()
+        self.hot_thresholds = dict()
+        self.current_hot_ids = set()
         self.current_new_ids = []
         self.update_current_ids = dict()
         for i in range(60):
             minute_string = f":0{i}" if i < 10 else f":{i}"
             self.update_current_ids[minute_string] = []
 
+        # Update tasks only exist for minutes that have memes to update
+        self.scheduler = AdaptiveScheduler(rate_limits = self.scraper.rate_limits,
+                                           clock = clock, sleep = sleep)
+        self.update_tasks = dict()
+        self.update_hours = 24
+        self.failsafe = False
+
+        # Reddit fetches run on the scheduler thread, database writes on pipeline writers
+        # Buckets are shared between both, so changes to them hold bucket_lock
+        self.pipeline = CollectionPipeline(num_writers)
+        self.bucket_lock = threading.Lock()
+
+        # Removal status of recent new memes, a post can still be removed later so entries expire
+        self.removal_cache = TTLCache(timedelta(minutes = 15).total_seconds(), clock = self.scheduler.clock)
+
+        # Memes that barely move are polled every few hours instead of every hour
+        MAX_POLL_INTERVAL = USER_PARAMS.get("collection", {}).get("MAX-POLL-INTERVAL-HOURS", 4)
+        self.cadence = PollingCadence(MAX_POLL_INTERVAL)
+
+        self.shard = ShardCoordinator(self.dbhelper, shard_id, clock = self.scheduler.clock) if shard_id else None
+        self.last_snapshot = None
+        # Set when collecting into an existing database, tracking then resumes from what is stored
+        self.resuming = False
+
     # Prepares the database and contained tables for data insertion
     # Note: this function does not cover the case where database exists but the tables doesn't
+    # Connections are only opened here, constructing a DataCollector has no side effects
     def prepare_database(self, database_name: str):
+        self.dbhelper.connect_server()
         if not self.dbhelper.database_exists(database_name):
             print("Database with the given name doesn't exist. Creating...")
             self.dbhelper.create_database(database_name, connect = True)
@@ -50,46 +96,83 @@ class DataCollector:
         else:
             print("Found existing database. Connecting...")
             self.dbhelper.connect_database(database_name)
+            self.dbhelper.create_indexes()
+            self.dbhelper.create_summary_tables()
+            self.resuming = True
         logging.info(f"Connection to {database_name} has been establised. Data will be stored there.")
+        if self.shard:
+            self.shard.prepare()
+            self.shard.heartbeat()
+            self.shard.refresh()
+            self.shard.start_heartbeat()
 
     def __retrieve_valid_newest_id(self):
+        # Checks every uncached candidate with a single batched request
+        self.removal_cache.prune()
+        unchecked_ids = [meme_id for meme_id in self.current_new_ids if meme_id not in self.removal_cache]
+        if unchecked_ids:
+            removed = self.scraper.find_removed(unchecked_ids)
+            if removed is not None:
+                for meme_id in unchecked_ids:
+                    self.removal_cache.set(meme_id, removed.get(meme_id))
+
         for meme_id in self.current_new_ids:
-            if not self.scraper.is_removed(meme_id):
+            if not self.removal_cache.get(meme_id):
                 return meme_id
             logging.info(f"{meme_id} is removed. Finding next new meme")
         return
 
     # Finds new memes from scraper, and updates to database
     def collect_new_meme_data(self):
+        # In a sharded run only the leader collects new memes
+        if self.shard and not self.shard.is_leader:
+            return
         logging.info("Collecting new memes...")
-        newest_id = self.__retrieve_valid_newest_id()
-        new_memes = self.scraper.find_new(before = newest_id)
+        with self.pipeline.stage("fetch"):
+            newest_id = self.__retrieve_valid_newest_id()
+            new_memes = self.scraper.find_new(before = newest_id)
         self.__log_current_rate_limit()
         if not new_memes:
             logging.info(f"No new memes after {newest_id}")
             return
         
+        self.pipeline.submit(self.__store_new_memes, new_memes)
+        # One transaction per collection tick
+        self.pipeline.submit(self.dbhelper.flush)
         for meme in new_memes:
-            self.dbhelper.insert_meme_info(meme["id"], meme["title"], meme["time_created"],
-             False, meme["meme_url"], meme["post_url"])
-            self.dbhelper.insert_meme_score(meme["id"], 0, 0)
-            self.dbhelper.insert_meme_comments(meme["id"], 0, 0)
-            self.dbhelper.insert_meme_status(meme["id"], 0, False)
-            self.update_current_ids[meme["time_created"][-6:-3]].append(meme["id"])
-            logging.info(f"{meme['id']} has been added to database")
+            # Memes of other shards are picked up by their owners on their next sync
+            if self.shard and not self.shard.owns(meme["id"]):
+                continue
+            with self.bucket_lock:
+                self.update_current_ids[meme["time_created"][-6:-3]].append(meme["id"])
+            self.__add_update_task(meme["time_created"][-6:-3])
         
         logging.info(f"{len(new_memes)} new memes added in total")
 
         self.current_new_ids = [meme["id"] for meme in new_memes]
         logging.info(f"New meme ids: {', '.join(self.current_new_ids)}")
 
-    # Retrieve current hottest "num_meme" meme ids
-    def collect_current_hot_meme_ids(self, num_memes: int = 100):
-        logging.info("Collecting current hot meme ids...")
-        current_hot_memes = self.scraper.find_hot(num_memes)
+    # Runs on a pipeline writer
+    def __store_new_memes(self, new_memes: list):
+        for meme in new_memes:
+            self.dbhelper.insert_meme_info(meme["id"], meme["title"], meme["time_created"],
+             False, meme["meme_url"], meme["post_url"], buffered = True)
+            self.dbhelper.insert_meme_snapshot(meme["id"], 0, 0, 0, False, buffered = True)
+            logging.info(f"{meme['id']} has been added to database")
+
+    # Retrieve current hottest "num_meme" meme ids of "subreddit" (default: the first one)
+    def collect_current_hot_meme_ids(self, num_memes: int = 100, subreddit: str = None):
+        subreddit = subreddit or self.scraper.subreddits[0]
+        logging.info(f"Collecting current hot meme ids of r/{subreddit}...")
+        with self.pipeline.stage("fetch"):
+            current_hot_memes = self.scraper.find_hot(num_memes, subreddit)
         if current_hot_memes:
-            self.current_hot_ids = [meme["id"] for meme in current_hot_memes]
-            logging.info("Collected current hot meme ids")
+            self.hot_ids_by_subreddit[subreddit] = [meme["id"] for meme in current_hot_memes]
+            # Swapped in whole, writers may be reading the previous set
+            self.current_hot_ids = {meme_id for meme_ids in self.hot_ids_by_subreddit.values() for meme_id in meme_ids}
+            self.hot_thresholds[subreddit] = min(meme["score"] for meme in current_hot_memes)
+            self.cadence.hot_threshold = min(self.hot_thresholds.values())
+            logging.info(f"Collected current hot meme ids of r/{subreddit}")
         
         self.__log_current_rate_limit()
 
@@ -98,30 +181,90 @@ class DataCollector:
 
     # Updates multiple current meme submissions
     # Will replace collect_existing_meme_data
-    def collect_existing_memes_data(self, time: str, update_hours: int = 24, failsafe: bool = False):
-        meme_ids = self.update_current_ids[time]
-        logging.info("Updating existing meme ids...")
+    # "meme_ids" (default: the memes of the bucket that are due) is used to retry deferred chunks
+    # "scheduled" is the time the update was due at (default: now), for the write lag metric
+    def collect_existing_memes_data(self, time: str, update_hours: int = 24, failsafe: bool = False,
+                                    meme_ids: list = None, scheduled: float = None):
+        scheduled = self.scheduler.clock() if scheduled is None else scheduled
+        if meme_ids is None:
+            with self.bucket_lock:
+                bucket_ids = list(self.update_current_ids[time])
+            logging.info("Updating existing meme ids...")
+            meme_ids = self.cadence.due(bucket_ids)
+            REGISTRY.increment("update_polls_skipped_total", len(bucket_ids) - len(meme_ids))
         if not meme_ids:
             logging.info("No memes needed to be updated.")
             return
 
-        updated_memes = self.scraper.find_multi_specific(meme_ids)
+        # Chunks are handed to the writers as soon as they are fetched
+        deferred_ids = []
+        fetch_start = timer.perf_counter()
+        for chunk_ids, updated_memes in self.scraper.iter_multi_specific(meme_ids):
+            self.pipeline.record("fetch", timer.perf_counter() - fetch_start)
+            if updated_memes is DEFERRED:
+                deferred_ids.extend(chunk_ids)
+            # Failsafe for updating existing memes:
+            # If memes cannot be updated (mainly due to connection error),
+            # These memes will be removed from the update list.
+            elif updated_memes is None:
+                if failsafe:
+                    self.__untrack(time, chunk_ids)
+                    for meme_id in chunk_ids:
+                        self.cadence.remove(meme_id)
+                    logging.info(f"{len(chunk_ids)} memes at {time} cannot be updated. Failsafe activated, these memes will not be updated anymore.")
+            else:
+                # Memes on their last update leave the bucket now, a later tick may start
+                # before the writers have stored this one and must not fetch them again
+                self.__untrack(time, [meme["id"] for meme in updated_memes
+                                      if self.__update_hour(meme)[0] >= update_hours])
+                self.pipeline.submit(self.__store_updated_memes, updated_memes, time, update_hours, scheduled)
+            fetch_start = timer.perf_counter()
 
-        # Failsafe for updating existing memes:
-        # If memes cannot be updated (mainly due to connection error),
-        # These memes will be removed from the update list.
-        if failsafe and (updated_memes == None):
-            self.update_current_ids[time] = []
-            logging.info(f"Memes at {time} cannot be updated. Failsafe activated, these memes will not be updated anymore.")
-            return
+        # One transaction per collection tick
+        self.pipeline.submit(self.dbhelper.flush)
+        self.__log_current_rate_limit()
+        if deferred_ids:
+            self.__defer_update(time, deferred_ids, scheduled)
+
+    # Memes left over when the rate limit budget ran out are updated once the window resets,
+    # the scheduler keeps running other tasks in the meantime
+    def __defer_update(self, time: str, meme_ids: list, scheduled: float):
+        retry_at = self.scraper.fetcher.reset_timestamp() or self.scheduler.clock()
+        logging.info(f"Rate limit budget used up, {len(meme_ids)} memes at {time} are updated at "
+                     f"{datetime.fromtimestamp(retry_at).strftime('%H:%M:%S')}")
+        self.scheduler.schedule(self.collect_existing_memes_data, time, self.update_hours, self.failsafe, meme_ids,
+                                scheduled, start = retry_at, priority = PRIORITY_UPDATE, tags = ("update", time))
+
+    # Removes "meme_ids" from the bucket at "time", ids no longer in it are skipped
+    def __untrack(self, time: str, meme_ids: list):
+        with self.bucket_lock:
+            bucket = self.update_current_ids[time]
+            for meme_id in meme_ids:
+                if meme_id in bucket:
+                    bucket.remove(meme_id)
 
+    # (hours_elapsed, is_hot): the hour the update of a fetched meme is recorded at,
+    # and whether the meme was hot at its latest stored update
+    # Hours since creation at the time it was fetched, slow memes skip hours between polls
+    # A meme without any update yet counts as updated just before hour 0
+    def __update_hour(self, meme: dict):
+        latest_hours_elapsed, is_hot = self.dbhelper.search_meme_latest_status(meme["id"]) or (-1, False)
+        created = datetime.strptime(meme["time_created"], "%Y-%m-%d %H:%M:%S").timestamp()
+        return max(round((meme["time_fetched"] - created) / 3600), latest_hours_elapsed + 1), is_hot
+
+    # Runs on a pipeline writer
+    def __store_updated_memes(self, updated_memes: list, time: str, update_hours: int, scheduled: float):
         for meme in updated_memes:
-            hours_elapsed, is_hot = self.dbhelper.search_meme_latest_status(meme["id"])
-            hours_elapsed += 1
+            hours_elapsed, is_hot = self.__update_hour(meme)
+            # Fetched too late for its last hour, or every hour was already stored by an earlier update
+            if hours_elapsed > update_hours:
+                self.__untrack(time, [meme["id"]])
+                self.dbhelper.status_index.remove(meme["id"])
+                self.cadence.remove(meme["id"])
+                continue
             entered_hot = self.__is_hot(meme["id"])
-            self.dbhelper.insert_meme_score(meme["id"], hours_elapsed, meme["score"])
-            self.dbhelper.insert_meme_comments(meme["id"], hours_elapsed, meme["num_comments"])
-            self.dbhelper.insert_meme_status(meme["id"], hours_elapsed, entered_hot)
+            self.dbhelper.insert_meme_snapshot(meme["id"], hours_elapsed, meme["score"], meme["num_comments"],
+                                               entered_hot, buffered = True)
             logging.info(f"{meme['id']} is updated")
 
             # Update if meme has newly entered hot
@@ -130,62 +273,163 @@ class DataCollector:
                 logging.info(f"{meme['id']} has entered hot, updated info")
 
             # Remove meme from self.update_current_ids after "update_hours" elapsed
+            # (usually done already when it was fetched, see collect_existing_memes_data)
             if hours_elapsed >= update_hours:
-                self.update_current_ids[time].remove(meme["id"])
-        
-        self.__log_current_rate_limit()
+                self.__untrack(time, [meme["id"]])
+                self.dbhelper.status_index.remove(meme["id"])
+                self.cadence.remove(meme["id"])
+            else:
+                self.cadence.record(meme["id"], hours_elapsed, meme["score"], meme["num_comments"], update_hours)
+        # How late the update is once it is written, including the time spent waiting for a writer
+        REGISTRY.observe("update_write_lag_seconds", self.scheduler.clock() - scheduled, minute = time[1:])
+
+    # The stored tables are the collector's checkpoint: meme_status holds the last hour written for
+    # every meme, so the tracked memes are rebuilt with one bulk query instead of a separate journal
+    # Returns the minute bucket of each meme that is still tracked (and owned, in a sharded run)
+    def __load_tracked_memes(self):
+        now = self.scheduler.clock()
+        since = datetime.fromtimestamp(now) - timedelta(hours = self.update_hours + 1)
+        tracked = dict()
+        for meme_id, creation_time, hours_elapsed, is_hot in self.dbhelper.search_tracked_memes(
+                since.strftime("%Y-%m-%d %H:%M:%S"), self.update_hours):
+            if self.shard and not self.shard.owns(meme_id):
+                continue
+            time = str(creation_time)[-6:-3]
+            # Hours missed while no collector was running cannot be fetched any more, the next
+            # update is recorded at the hour it falls on (see __store_updated_memes)
+            created = datetime.strptime(str(creation_time), "%Y-%m-%d %H:%M:%S").timestamp()
+            hours_due = round((self.scheduler.next_minute_of_hour(time) - created) / 3600)
+            if hours_due > self.update_hours:
+                continue
+            tracked[meme_id] = time
+            self.dbhelper.status_index.update(meme_id, hours_elapsed, is_hot)
+        return tracked
+
+    # Makes the buckets hold exactly "tracked" and schedules their update tasks
+    def __rebuild_buckets(self, tracked: dict):
+        with self.bucket_lock:
+            bucketed = set()
+            for time, meme_ids in self.update_current_ids.items():
+                for meme_id in [meme_id for meme_id in meme_ids if meme_id not in tracked]:
+                    meme_ids.remove(meme_id)
+                    self.dbhelper.status_index.remove(meme_id)
+                    self.cadence.remove(meme_id)
+                bucketed.update(meme_ids)
+            for meme_id, time in tracked.items():
+                if meme_id not in bucketed:
+                    self.update_current_ids[time].append(meme_id)
+        # Each bucket keeps its own minute, so catching up is spread over the hour
+        for time, meme_ids in self.update_current_ids.items():
+            if meme_ids:
+                self.__add_update_task(time)
+
+    # Resumes tracking after a restart, new collection continues after the newest stored memes
+    def resume_tracking(self):
+        start = timer.perf_counter()
+        self.__rebuild_buckets(self.__load_tracked_memes())
+        self.current_new_ids = self.dbhelper.search_newest_meme_ids()
+        with self.bucket_lock:
+            num_tracked = sum(len(meme_ids) for meme_ids in self.update_current_ids.values())
+        logging.info(f"Resumed tracking of {num_tracked} memes in {timer.perf_counter() - start:.2f}s")
 
-    # Removes update tasks when there is no update needed in a certain minute,
-    # After the collector stops collecting new memes
-    def __remove_update_tasks(self):
-        logging.info("Clearing unused update tasks...")
-        if schedule.get_jobs("new"):
+    # Sharded mode: make the buckets hold exactly the tracked memes this worker owns
+    # Runs every minute, so memes of a dead worker are taken over once its heartbeat expires
+    # (heartbeats have a thread of their own, see ShardCoordinator.start_heartbeat)
+    def sync_shard(self):
+        self.shard.refresh()
+        # A new leader continues new collection from the newest memes already stored
+        if self.shard.is_leader and not self.current_new_ids:
+            self.current_new_ids = self.dbhelper.search_newest_meme_ids()
+        self.__rebuild_buckets(self.__load_tracked_memes())
+
+    # Runs the hourly update of one minute bucket, and removes its task once the bucket is empty
+    def __run_update_task(self, time: str):
+        # How late this bucket's update starts compared to its scheduled minute
+        scheduled = self.update_tasks[time].due
+        lag = self.scheduler.clock() - scheduled
+        REGISTRY.observe("update_bucket_lag_seconds", lag, minute = time[1:])
+        REGISTRY.set_gauge("update_bucket_last_lag_seconds", lag, minute = time[1:])
+        with REGISTRY.timer("update_bucket_seconds"):
+            self.collect_existing_memes_data(time, self.update_hours, self.failsafe, scheduled = scheduled)
+        with self.bucket_lock:
+            bucket_empty = not self.update_current_ids[time]
+        if bucket_empty:
+            self.scheduler.cancel(self.update_tasks.pop(time))
+            logging.info(f"Removed update task at {time}")
+
+    # Schedule an hourly update task at "time" if the minute has none yet
+    def __add_update_task(self, time: str):
+        if time in self.update_tasks:
             return
-        for time in self.update_current_ids.keys():
-            if not self.update_current_ids[time]:
-                [job] = schedule.get_jobs(time)
-                schedule.cancel_job(job)
-                logging.info(f"Removed update task at {time}")
+        self.update_tasks[time] = self.scheduler.schedule(
+            self.__run_update_task, time,
+            start = self.scheduler.next_minute_of_hour(time),
+            interval = timedelta(hours = 1).total_seconds(),
+            priority = PRIORITY_UPDATE, tags = ("update", time)
+        )
 
     # Schedule new/hot collection tasks
+    # New memes of all subreddits come from one merged listing. Hot is listed per subreddit,
+    # those tasks are staggered over the interval and share the rate limit budget fairly
     def __collection_tasks(self, collect_new_hours: int):
-        schedule.every(5).minutes.do(self.collect_new_meme_data) \
-        .until(timedelta(hours = collect_new_hours)) \
-        .tag("new")
-        schedule.every(5).minutes.do(self.collect_current_hot_meme_ids) \
-        .tag("hot")
-
-    # Schedule update tasks
-    def __update_tasks(self, update_hours: int, failsafe: bool = False):
-        for time in self.update_current_ids.keys():
-            schedule.every().hour.at(time).do(
-                self.collect_existing_memes_data, time, update_hours, failsafe
-            ) \
-            .tag("update", time)
-    
-    # Schedule update task removal task
-    def __remove_tasks(self):
-        schedule.every().hour.do(
-            self.__remove_update_tasks
-        )
+        interval = timedelta(minutes = 5).total_seconds()
+        now = self.scheduler.clock()
+        until = now + timedelta(hours = collect_new_hours).total_seconds()
+        subreddits = self.scraper.subreddits
+        for i, subreddit in enumerate(subreddits):
+            self.scheduler.schedule(self.collect_current_hot_meme_ids, 100, subreddit,
+                                    start = now + i * interval / len(subreddits), interval = interval,
+                                    priority = PRIORITY_HOT, tags = ("hot", subreddit), group = subreddit)
+        self.scheduler.schedule(self.collect_new_meme_data, interval = interval, until = until,
+                                priority = PRIORITY_NEW, tags = ("new",))
 
     # Used for logging after a request
     def __log_current_rate_limit(self):
-        rates = self.scraper.reddit.auth.limits
+        self.__write_metrics_snapshot()
+        rates = self.scraper.rate_limits()
         if rates['reset_timestamp'] is None:
             logging.warning("Unable to get current rate limits.")
             return
         reset_time = datetime.fromtimestamp(rates['reset_timestamp'])
         logging.info(f"Rate Limit: Used: {rates['used']} Remaining: {rates['remaining']} Next Reset: {reset_time.strftime('%Y-%m-%d, %H:%M:%S')}")
+        logging.info(self.pipeline.report())
+        REGISTRY.set_gauge("reddit_ratelimit_used", rates['used'])
+        REGISTRY.set_gauge("reddit_ratelimit_remaining", rates['remaining'])
+        REGISTRY.set_gauge("reddit_ratelimit_reset_seconds", max(rates['reset_timestamp'] - self.scheduler.clock(), 0))
+
+    # Rewritten at most once a minute, the snapshot grows with every labelled series
+    def __write_metrics_snapshot(self):
+        now = self.scheduler.clock()
+        if self.last_snapshot is not None and now - self.last_snapshot < 60:
+            return
+        self.last_snapshot = now
+        with self.bucket_lock:
+            REGISTRY.set_gauge("tracked_memes", sum(len(meme_ids) for meme_ids in self.update_current_ids.values()))
+        snapshot_file = USER_PARAMS.get("metrics", {}).get("SNAPSHOT-FILE")
+        if snapshot_file:
+            REGISTRY.write_snapshot(snapshot_file)
 
     # Configure and run
     def run(self, collect_new_hours: int, update_hours: int, failsafe: bool = False):
+        self.update_hours = update_hours
+        self.failsafe = failsafe
+        if self.resuming:
+            self.resume_tracking()
         self.__collection_tasks(collect_new_hours)
-        schedule.run_all()
-        self.__update_tasks(update_hours, failsafe)
-        self.__remove_tasks()
+        if self.shard:
+            self.scheduler.schedule(self.sync_shard, interval = timedelta(minutes = 1).total_seconds(),
+                                    priority = PRIORITY_UPDATE, tags = ("shard",))
+        self.pipeline.start()
+        metrics_port = USER_PARAMS.get("metrics", {}).get("PORT")
+        if metrics_port:
+            REGISTRY.serve(metrics_port, USER_PARAMS["metrics"].get("HOST") or "127.0.0.1")
 
-        # Stops when there is nothing to update
-        while schedule.get_jobs("update"):
-            schedule.run_pending()
+        # Stops when new memes are no longer collected and there is nothing to update
+        self.scheduler.run(
+            lambda: self.scheduler.get_tasks("new") or self.scheduler.get_tasks("update")
+        )
+        self.pipeline.stop()
+        if self.shard:
+            self.shard.stop_heartbeat()
+        logging.info(self.pipeline.report())
         logging.info("Collection finished")
\ No newline at end of file
@@ -9,5 +9,36 @@ USER_PARAMS = {
         "HOST-NAME": "",
         "USER-NAME": "",
         "USER-PASSWORD": "",
+    },
+    # Database to collect into, and subreddits tracked by one collector process
+    "collection": {
+        "DATABASE-NAME": "memes0625",
+        "SUBREDDITS": ["memes"],
+        "COLLECT-NEW-HOURS": 24,
+        "UPDATE-HOURS": 24,
+        # Memes whose score barely moves are polled every 2, then up to this many hours (1: every hour)
+        "MAX-POLL-INTERVAL-HOURS": 4,
+    },
+    # Optional: one entry per shard of a sharded run, each like "reddit" above
+    "reddit-shards": [],
+    # "mysql", or "sqlite" to store each database as a local file in SQLITE-DIRECTORY
+    "storage": {
+        "BACKEND": "mysql",
+        "SQLITE-DIRECTORY": "",
+        # Schema of new databases: "tables", or "snapshot" for one meme_snapshot table
+        # in place of meme_score, meme_comments and meme_status (see migrate.py)
+        "SCHEMA": "tables",
+    },
+    # Prometheus text on http://HOST:PORT/metrics (0 to disable), and a JSON
+    # snapshot file rewritten at most once a minute, after a collection tick ("" to disable)
+    # HOST is the interface to listen on, "0.0.0.0" makes the metrics reachable from other machines
+    "metrics": {
+        "PORT": 0,
+        "HOST": "127.0.0.1",
+        "SNAPSHOT-FILE": "metrics.json",
+    },
+    # DEBUG logs of every praw/prawcore request, costly under load
+    "logging": {
+        "PRAW-DEBUG": False,
     }
 }
\ No newline at end of file
@@ -1,61 +1,201 @@
-import mysql.connector
-from mysql.connector import Error
+import argparse
 import csv
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from backends import StorageBackend, configured_backend
+from summaries import SUMMARY_TABLES
 
-def create_connection(hostname: str, username: str, 
-                      password: str, database_name: str = None):
-    connection = None
-    try:
-        connection = mysql.connector.connect(
-            host = hostname,
-            user = username,
-            passwd = password,
-            database = database_name
-        )
-        print("Connection successful")
-        return connection
-    except Error as e:
-        print(f"Error: {e}")
+# Tables are read through the storage backend configured in config.py (MySQL or SQLite)
+# pyarrow is imported when first used, and the database driver by the backend,
+# so importing this module (e.g. from the command line entry point) stays cheap
+
+# Rows fetched from the database per round trip while streaming a table
+EXPORT_BATCH_SIZE = 10000
+
+# Last exported observation time of each table, used by incremental exports
+WATERMARK_FILE = "export_watermarks.json"
+# Watermarks saved in another format are ignored, the next export then starts over
+WATERMARK_VERSION = 2
+
+# Rows observed within this margin of an export are left for the next one, so that rows
+# stored after the watermark has passed their observed time are not skipped for good:
+# an update is placed at its fetch time rounded to the hour (up to 30 minutes early),
+# a chunk can be deferred until the rate limit window resets (10 minutes on Reddit),
+# and buffered rows wait for the next flush
+WATERMARK_MARGIN = timedelta(minutes = 30) + timedelta(minutes = 10) + timedelta(minutes = 5)
+
+# Hours a meme is tracked for after its creation (UPDATE-HOURS, plus one for late updates)
+DEFAULT_TRACKING_HOURS = 25
 
-def fetch_results(query: str):
-    cursor = conn.cursor()
+def fetch_columns(table_name: str, connection):
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT * FROM {table_name} LIMIT 0;")
+    cursor.fetchall()
+    return [column[0] for column in cursor.description]
+
+# Time at which a row was observed, used as the incremental export watermark
+# The hourly tables have no insertion time, so their rows are placed at the
+# meme's creation time plus hours_elapsed
+# entered_hot of meme_info is set while a meme is tracked, so a meme_info row
+# is observed (and exported once, with its final value) when its tracking ends
+# The rollup tables are rewritten in place and have no meme_id to join on,
+# so they are exported in full every time
+def observed_time_expression(backend: StorageBackend, table_name: str, columns: list,
+                             tracking_hours: int = DEFAULT_TRACKING_HOURS):
+    if table_name in SUMMARY_TABLES:
+        return
+    if table_name == "meme_info":
+        return backend.add_hours("t.creation_time", tracking_hours)
+    if "hours_elapsed" in columns:
+        return backend.add_hours("i.creation_time", "t.hours_elapsed")
+    return
+
+def table_export_query(backend: StorageBackend, table_name: str, columns: list, since: str = None,
+                       until: str = None, tracking_hours: int = DEFAULT_TRACKING_HOURS):
+    observed_time = observed_time_expression(backend, table_name, columns, tracking_hours)
+    if observed_time is None or until is None:
+        return f"SELECT * FROM {table_name};"
+    join = "" if table_name == "meme_info" else "JOIN meme_info i ON t.meme_id = i.meme_id"
+    lower_bound = f"AND {observed_time} > '{since}'" if since else ""
+    return f"""
+    SELECT t.*
+    FROM {table_name} t {join}
+    WHERE {observed_time} <= '{until}' {lower_bound};
+    """
+
+# Streams the rows of a query in batches of "batch_size",
+# so the table is never held in memory as a whole
+def stream_results(query: str, connection, batch_size: int = EXPORT_BATCH_SIZE):
+    cursor = connection.cursor()
     try:
         cursor.execute(query)
-        return cursor.fetchall()
-    except Error as e:
-        return f"Error: {e}"
-
-def fetch_tables():
-    tables = [result[0] for result in fetch_results("SHOW TABLES;")]
-    return tables
-
-def fetch_columns(table_name: str):
-    columns = [result[0] for result in fetch_results(f"DESCRIBE {table_name};")]
-    return columns
-
-def fetch_table_data(table_name: str):
-    data = fetch_results(f"SELECT * FROM {table_name};")
-    return data
-
-def table_to_csv(table_name: str):
-    with open(f'{table_name}.csv', 'w', newline = '', encoding = 'utf-8') as csvfile:
-        column_names = fetch_columns(table_name)
-        table_data = fetch_table_data(table_name)      
-        writer = csv.writer(csvfile)
-        writer.writerow(column_names)
-        writer.writerows(table_data)
-
-def export_data_from_db():
-    tables = fetch_tables()
-    for table in tables:
-        table_to_csv(table)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield rows
+    finally:
+        cursor.close()
+
+def table_to_csv(backend: StorageBackend, table_name: str, since: str = None, until: str = None,
+                 output_dir: str = ".", tracking_hours: int = DEFAULT_TRACKING_HOURS):
+    path = os.path.join(output_dir, f'{table_name}.csv')
+    # An export retried after a lost connection starts again from where this one started
+    start_size = os.path.getsize(path) if os.path.exists(path) else 0
+    def work(connection):
+        column_names = fetch_columns(table_name, connection)
+        query = table_export_query(backend, table_name, column_names, since, until, tracking_hours)
+        # Incremental exports append to the file written by the previous export
+        append = (since is not None and os.path.exists(path)
+                  and observed_time_expression(backend, table_name, column_names) is not None)
+        with open(path, 'a' if append else 'w', newline = '', encoding = 'utf-8') as csvfile:
+            writer = csv.writer(csvfile)
+            if append:
+                csvfile.truncate(start_size)
+            else:
+                writer.writerow(column_names)
+            for rows in stream_results(query, connection):
+                writer.writerows(rows)
+        return True
+    return backend.run(work)
+
+def table_to_parquet(backend: StorageBackend, table_name: str, since: str = None, until: str = None,
+                     output_dir: str = ".", tracking_hours: int = DEFAULT_TRACKING_HOURS):
+    # Parquet export is optional, install pyarrow to enable it
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        pa = None
+    assert pa is not None, "pyarrow is required for Parquet export"
+    def work(connection):
+        column_names = fetch_columns(table_name, connection)
+        query = table_export_query(backend, table_name, column_names, since, until, tracking_hours)
+        # Incremental exports are written as a new file next to the previous ones
+        suffix = ""
+        if since is not None and observed_time_expression(backend, table_name, column_names) is not None:
+            suffix = "_since_" + since.replace("-", "").replace(":", "").replace(" ", "")
+        writer = None
+        try:
+            for rows in stream_results(query, connection):
+                batch = pa.Table.from_arrays([pa.array(column) for column in zip(*rows)], names = column_names)
+                if writer is None:
+                    writer = pq.ParquetWriter(os.path.join(output_dir, f'{table_name}{suffix}.parquet'), batch.schema)
+                writer.write_table(batch.cast(writer.schema))
+        finally:
+            if writer is not None:
+                writer.close()
+        return True
+    return backend.run(work)
+
+def load_watermarks(output_dir: str = "."):
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return dict()
+    with open(path, encoding = 'utf-8') as f:
+        watermarks = json.load(f)
+    if watermarks.get("version") != WATERMARK_VERSION:
+        print(f"{WATERMARK_FILE} is from an older version, exporting every table again")
+        return dict()
+    return watermarks["tables"]
+
+def save_watermarks(watermarks: dict, output_dir: str = "."):
+    with open(os.path.join(output_dir, WATERMARK_FILE), 'w', encoding = 'utf-8') as f:
+        json.dump({"version": WATERMARK_VERSION, "tables": watermarks}, f, indent = 4)
+
+# Returns whether "table_name" was exported, a failed table does not stop the others
+def export_table(backend: StorageBackend, table_name: str, file_format: str = "csv", since: str = None,
+                 until: str = None, output_dir: str = ".", tracking_hours: int = DEFAULT_TRACKING_HOURS):
+    export = table_to_parquet if file_format == "parquet" else table_to_csv
+    try:
+        exported = export(backend, table_name, since, until, output_dir, tracking_hours)
+    except backend.error as e:
+        print(f"Error: {e}")
+        exported = False
+    print(f"Exported {table_name}" if exported else f"Failed to export {table_name}")
+    return bool(exported)
+
+# Exports every table as CSV or Parquet, "workers" tables at a time
+# With "incremental", only rows observed since the last export are pulled
+def export_data_from_db(backend: StorageBackend, file_format: str = "csv", incremental: bool = False,
+                        workers: int = 4, output_dir: str = ".", tracking_hours: int = DEFAULT_TRACKING_HOURS):
+    tables = backend.table_names()
+    watermarks = load_watermarks(output_dir) if incremental else dict()
+    until = (datetime.now() - WATERMARK_MARGIN).strftime("%Y-%m-%d %H:%M:%S") if incremental else None
+
+    with ThreadPoolExecutor(max_workers = workers) as executor:
+        futures = {table: executor.submit(export_table, backend, table, file_format, watermarks.get(table),
+                                          until, output_dir, tracking_hours) for table in tables}
+    exported = [table for table, future in futures.items() if future.result()]
+
+    # Tables that failed are exported from their previous watermark next time
+    if incremental:
+        watermarks.update({table: until for table in exported})
+        save_watermarks(watermarks, output_dir)
+
+# Exports the database in config.py, used by "python main.py export"
+def main(argv: list = None, prog: str = None):
+    from config import USER_PARAMS
+    parser = argparse.ArgumentParser(prog = prog, description = "Export every table of the collector database")
+    parser.add_argument("--database", default = USER_PARAMS["collection"]["DATABASE-NAME"])
+    parser.add_argument("--format", choices = ("csv", "parquet"), default = "csv")
+    parser.add_argument("--incremental", action = "store_true", help = "only export rows observed since the last export")
+    parser.add_argument("--output-dir", default = ".")
+    parser.add_argument("--workers", type = int, default = 4, help = "tables exported in parallel")
+    args = parser.parse_args(argv)
+
+    backend = configured_backend(pool_size = args.workers)
+    if not backend.connect():
+        return
+    if not backend.database_exists(args.database):
+        print(f"Database {args.database} does not exist")
+        return
+    backend.connect(args.database)
+    os.makedirs(args.output_dir, exist_ok = True)
+    export_data_from_db(backend, args.format, args.incremental, args.workers, args.output_dir,
+                        USER_PARAMS["collection"]["UPDATE-HOURS"] + 1)
 
 if __name__ == "__main__":
-    # Fill in your MySQL credentials
-    conn = create_connection(
-        hostname="",
-        username="",
-        password="",
-        database_name=""
-    )
-    export_data_from_db()
\ No newline at end of file
+    main()
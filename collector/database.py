@@ -8,63 +8,97 @@
 # Subject to change later according to performance
 # Thinking if this can be configured
 
-import mysql.connector
-from mysql.connector import Error
+import logging
+import time
+import threading
 import queries
+import summaries
+from backends import StorageBackend, MySQLBackend
+from meme_state import MemeStateIndex
+from metrics import REGISTRY
+
+# Buffered rows are flushed in this order, so that rows referencing meme_info
+# are always written after the meme_info row they point to
+BUFFERED_TABLES = ("meme_info", "meme_score", "meme_comments", "meme_status", "meme_snapshot")
+
+# "tables": meme_score, meme_comments and meme_status get one row each per hourly update
+# "snapshot": a single meme_snapshot row per update, with views under the three old names
+SCHEMAS = ("tables", "snapshot")
 
 class DatabaseHelper:
 
-    def __init__(self, host_name: str, user_name: str, user_password: str):
-        self.hostname = host_name
-        self.username = user_name
-        self.password = user_password
-        self.connection = None
+    # Uses MySQL with the given credentials unless another storage backend is passed
+    # "schema" is used for new databases, existing databases keep the schema they were created with
+    def __init__(self, host_name: str = None, user_name: str = None, user_password: str = None,
+                 batch_size: int = 500, flush_interval: int = 60,
+                 pool_size: int = 4, max_retries: int = 5, retry_delay: float = 1,
+                 backend: StorageBackend = None, schema: str = "tables"):
+        assert schema in SCHEMAS, f"Unknown schema {schema}, expected one of {', '.join(SCHEMAS)}"
+        self.backend = backend or MySQLBackend(host_name, user_name, user_password,
+                                               pool_size, max_retries, retry_delay)
         self.current_database = None
+        self.schema = schema
+
+        # Write buffer: rows are collected per table and written in one transaction
+        # when "batch_size" rows are pending or "flush_interval" seconds have passed
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.write_buffer = {table_name: [] for table_name in BUFFERED_TABLES}
+        self.buffered_rows = 0
+        self.last_flush = time.monotonic()
+        self.buffer_lock = threading.Lock()
+        # Flushes are serialized so rows never commit before the meme_info rows they reference
+        self.flush_lock = threading.Lock()
+
+        # Latest status of each meme, kept current by insert_meme_status
+        self.status_index = MemeStateIndex()
     
     def __create_connection(self, database_name: str = None):
-        connection = None
-        try:
-            connection = mysql.connector.connect(
-                host = self.hostname,
-                user = self.username,
-                passwd = self.password,
-                database = database_name
-            )
-            print("Connection successful")
-            self.connection = connection
+        if self.backend.connect(database_name):
             self.current_database = database_name
-        except Error as e:
-            print(f"Error: {e}")
 
     def connect_server(self):
         self.__create_connection()
 
     def connect_database(self, database_name: str):
         self.__create_connection(database_name)
+        if self.current_database == database_name:
+            self.schema = self.detect_schema() or self.schema
 
-    def execute_query(self, query: str, mode: str = "update"):
-        assert self.connection, "No connection is established, connect to server/database first"
-        cursor = self.connection.cursor()
-        try:
-            cursor.execute(query)
-        except Error as e:
-            print(f"Error: {e}")
-        if mode == "update":
-            self.connection.commit()
-            return
-        if mode == "search":
-            return cursor.fetchall()
-        if mode == "create":
-            return
+    # Schema of the current database, or None while it has no tables yet
+    def detect_schema(self):
+        table_names = self.backend.table_names()
+        if "meme_snapshot" in table_names:
+            return "snapshot"
+        if "meme_score" in table_names:
+            return "tables"
+
+    # With "params" the query runs as a prepared statement
+    def execute_query(self, query: str, mode: str = "update", params: tuple = None):
+        assert self.backend.connected, "No connection is established, connect to server/database first"
+        query = self.backend.prepare(query)
+        def work(connection):
+            cursor = (self.backend.prepared_cursor(connection, query) if params is not None
+                      else self.backend.cursor(connection))
+            try:
+                cursor.execute(query, params or ())
+            except self.backend.connection_errors:
+                raise
+            except self.backend.error as e:
+                print(f"Error: {e}")
+                return
+            if mode == "search":
+                return cursor.fetchall()
+            connection.commit()
+        with REGISTRY.timer("db_operation_seconds", operation = mode):
+            return self.backend.run(work)
         
     # Given a database_name, check if a database exists
     def database_exists(self, database_name: str):
-        result = self.execute_query(queries.SHOW_ALL_DATABASES_QUERY, mode = "search")
-        current_databases = [item[0] for item in result]
-        return database_name in current_databases
+        return self.backend.database_exists(database_name)
 
     def create_database(self, database_name: str, connect: bool = False):
-        self.execute_query(queries.database_creation_query(database_name), mode = "create")
+        self.backend.create_database(database_name)
         # If user wants to connect immediately
         if connect:
             self.connect_database(database_name)
@@ -72,35 +106,188 @@ class DatabaseHelper:
     def create_tables(self):
         assert self.current_database, "Current database is not specified"
         self.execute_query(queries.MEME_INFO_CREATION_QUERY, mode = "create")
-        self.execute_query(queries.MEME_SCORE_CREATION_QUERY, mode = "create")
-        self.execute_query(queries.MEME_COMMENTS_CREATION_QUERY, mode = "create")
-        self.execute_query(queries.MEME_STATUS_CREATION_QUERY, mode = "create")
+        self.create_indexes()
+        if self.schema == "snapshot":
+            self.execute_query(queries.MEME_SNAPSHOT_CREATION_QUERY, mode = "create")
+            for view_query in queries.SNAPSHOT_VIEW_QUERIES.values():
+                self.execute_query(view_query, mode = "create")
+        else:
+            self.execute_query(queries.MEME_SCORE_CREATION_QUERY, mode = "create")
+            self.execute_query(queries.MEME_COMMENTS_CREATION_QUERY, mode = "create")
+            self.execute_query(queries.MEME_STATUS_CREATION_QUERY, mode = "create")
+        self.create_summary_tables()
+
+    # Indexes the collector's lookups rely on, also added to databases created before them
+    def create_indexes(self):
+        if "meme_info_creation_time" not in self.backend.index_names():
+            self.execute_query(queries.MEME_INFO_CREATION_TIME_INDEX_QUERY, mode = "create")
+
+    # Rollup tables (see summaries.py), filled from the raw tables once if the database predates them
+    def create_summary_tables(self):
+        self.execute_query(queries.MEME_SUMMARY_CREATION_QUERY, mode = "create")
+        self.execute_query(queries.HOURLY_SUMMARY_CREATION_QUERY, mode = "create")
+        if (self.execute_query(queries.SUMMARY_NEEDS_BACKFILL_QUERY, mode = "search") or [(0,)])[0][0]:
+            print("Filling summary tables from existing data...")
+            self.execute_query(queries.MEME_SUMMARY_BACKFILL_QUERY)
+            self.execute_query(queries.HOURLY_SUMMARY_BACKFILL_QUERY)
+
+    # Rows the rollups are computed from always go through flush, which keeps the rollups current
+    def insert_data(self, table_name: str, *values, buffered: bool = False):
+        if buffered or table_name in summaries.SOURCE_TABLES:
+            self.buffer_data(table_name, *values)
+            if not buffered:
+                self.flush()
+            return
+        self.execute_query(queries.insert_many_query(table_name, len(values)), params = values)
 
-    def insert_data(self, table_name: str, *values):
-        self.execute_query(queries.insert_query(table_name, *values))
+    # Queue a row in the write buffer, flushes when the buffer is full or stale
+    def buffer_data(self, table_name: str, *values):
+        with self.buffer_lock:
+            self.write_buffer[table_name].append(values)
+            self.buffered_rows += 1
+            flush_needed = (self.buffered_rows >= self.batch_size
+                            or time.monotonic() - self.last_flush >= self.flush_interval)
+        if flush_needed:
+            self.flush()
+
+    # Writes all buffered rows with one executemany per table and a single commit
+    # The rollups of the written rows are merged in by the same transaction
+    # Note: mysql.connector turns executemany on INSERT into a multi-row INSERT,
+    # which takes fewer round trips than executing a prepared statement per row
+    def flush(self):
+        with self.flush_lock:
+            with self.buffer_lock:
+                self.last_flush = time.monotonic()
+                if not self.buffered_rows:
+                    return
+                pending = self.write_buffer
+                num_rows = self.buffered_rows
+                self.write_buffer = {table_name: [] for table_name in BUFFERED_TABLES}
+                self.buffered_rows = 0
+
+            # A lost connection rolls the transaction back, so the whole batch is retried
+            # Returns the rows that were written, a rejected batch is retried row by row
+            def work(connection):
+                cursor = self.backend.cursor(connection)
+                try:
+                    for table_name, rows in pending.items():
+                        if rows:
+                            query = self.backend.prepare(queries.insert_many_query(table_name, len(rows[0])))
+                            cursor.executemany(query, rows)
+                    self.__merge_rollups(cursor, pending)
+                    connection.commit()
+                    return pending
+                except self.backend.connection_errors:
+                    raise
+                except self.backend.error as e:
+                    connection.rollback()
+                    logging.warning(f"Flush of {num_rows} rows failed ({e}), writing them one row at a time")
+                return self.__write_row_by_row(connection, cursor, pending)
+            assert self.backend.connected, "No connection is established, connect to server/database first"
+            with REGISTRY.timer("db_operation_seconds", operation = "flush"):
+                written = self.backend.run(work) or dict()
+            for table_name, rows in pending.items():
+                num_written = len(written.get(table_name, ()))
+                REGISTRY.increment("db_rows_written_total", num_written, table = table_name)
+                if num_written < len(rows):
+                    REGISTRY.increment("db_rows_failed_total", len(rows) - num_written, table = table_name)
+                    logging.error(f"{len(rows) - num_written} of {len(rows)} {table_name} rows were not written")
+
+    # Merges the rollups of "rows" ({table_name: [row, ...]}) into the summary tables
+    def __merge_rollups(self, cursor, rows: dict):
+        for table_name, summary_rows in summaries.summarize(rows).items():
+            if summary_rows:
+                columns, key_columns, merge = summaries.SUMMARY_TABLES[table_name]
+                query = self.backend.upsert_query(table_name, columns, key_columns, merge)
+                cursor.executemany(self.backend.prepare(query), summary_rows)
+
+    # Fallback of flush when the batch was rejected (e.g. a duplicate key): only the offending
+    # rows are lost, and the rollups only count the rows that were written
+    def __write_row_by_row(self, connection, cursor, pending: dict):
+        written = {table_name: [] for table_name in pending}
+        try:
+            for table_name, rows in pending.items():
+                for row in rows:
+                    try:
+                        cursor.execute(self.backend.prepare(queries.insert_many_query(table_name, len(row))), row)
+                    except self.backend.connection_errors:
+                        raise
+                    except self.backend.error as e:
+                        logging.warning(f"{table_name} row {row[:2]} was not written: {e}")
+                    else:
+                        written[table_name].append(row)
+            self.__merge_rollups(cursor, written)
+            connection.commit()
+        except self.backend.connection_errors:
+            raise
+        except self.backend.error as e:
+            connection.rollback()
+            logging.error(f"Rollups could not be merged ({e}), the flush was rolled back")
+            return dict()
+        return written
 
     # Insert in meme_info
     def insert_meme_info(self, meme_id: str, meme_title: str, creation_time: str,
-                         entered_hot: bool, meme_url: str, post_url: str):
+                         entered_hot: bool, meme_url: str, post_url: str, buffered: bool = False):
         self.insert_data("meme_info", meme_id, meme_title, creation_time,
-                         entered_hot, meme_url, post_url)
+                         entered_hot, meme_url, post_url, buffered = buffered)
+
+    # One hourly update of a meme: a meme_snapshot row, or a row in each of the three tables
+    def insert_meme_snapshot(self, meme_id: str, hours_elapsed: int, score: int, num_comments: int,
+                             is_hot: bool, buffered: bool = False):
+        if self.schema == "snapshot":
+            self.insert_data("meme_snapshot", meme_id, hours_elapsed, score, num_comments, is_hot,
+                             buffered = buffered)
+            self.status_index.update(meme_id, hours_elapsed, is_hot)
+            return
+        self.insert_meme_score(meme_id, hours_elapsed, score, buffered = buffered)
+        self.insert_meme_comments(meme_id, hours_elapsed, num_comments, buffered = buffered)
+        self.insert_meme_status(meme_id, hours_elapsed, is_hot, buffered = buffered)
 
+    # The three per-table inserts below only apply to the "tables" schema
     # Insert in meme_score
-    def insert_meme_score(self, meme_id: str, hours_elapsed: int, score: int):
-        self.insert_data("meme_score", meme_id, hours_elapsed, score)
+    def insert_meme_score(self, meme_id: str, hours_elapsed: int, score: int, buffered: bool = False):
+        self.insert_data("meme_score", meme_id, hours_elapsed, score, buffered = buffered)
 
-    def insert_meme_comments(self, meme_id: str, hours_elapsed: int, num_comments: int):
-        self.insert_data("meme_comments", meme_id, hours_elapsed, num_comments)
+    def insert_meme_comments(self, meme_id: str, hours_elapsed: int, num_comments: int,
+                             buffered: bool = False):
+        self.insert_data("meme_comments", meme_id, hours_elapsed, num_comments, buffered = buffered)
 
-    def insert_meme_status(self, meme_id: str, hours_elapsed: int, is_hot: int):
-        self.insert_data("meme_status", meme_id, hours_elapsed, is_hot)
+    def insert_meme_status(self, meme_id: str, hours_elapsed: int, is_hot: int, buffered: bool = False):
+        self.insert_data("meme_status", meme_id, hours_elapsed, is_hot, buffered = buffered)
+        self.status_index.update(meme_id, hours_elapsed, is_hot)
     
     def update_meme_info(self, meme_id: str, entered_hot: bool):
-        self.execute_query(queries.update_meme_info_query(meme_id, entered_hot))
+        self.execute_query(queries.UPDATE_MEME_INFO_QUERY, params = (entered_hot, meme_id))
 
+    # (meme_id, creation_time, hours_elapsed, is_hot) of memes created since "since"
+    # that have been updated for less than "update_hours"
+    def search_tracked_memes(self, since: str, update_hours: int):
+        return self.execute_query(queries.TRACKED_MEMES_QUERY, mode = "search",
+                                  params = (since, update_hours)) or []
+
+    # (latest_hour, latest_score, peak_score, peak_hour, comments_hour, latest_comments, first_hot_hour)
+    # of one meme from meme_summary, or None if nothing was recorded for it
+    def search_meme_summary(self, meme_id: str):
+        results = self.execute_query(queries.MEME_SUMMARY_QUERY, mode = "search", params = (meme_id,))
+        return results[0] if results else None
+
+    # (hours_elapsed, num_memes, total_score, total_comments, num_hot) for every hour
+    def search_hourly_summary(self):
+        return self.execute_query(queries.HOURLY_SUMMARY_QUERY, mode = "search") or []
+
+    def search_newest_meme_ids(self, num_memes: int = 10):
+        results = self.execute_query(queries.NEWEST_MEMES_QUERY, mode = "search", params = (num_memes,))
+        return [result[0] for result in results or []]
+
+    # (hours_elapsed, is_hot) of the latest update of a meme, or None if it has none
+    # Served from the status index, falls back to the database for memes not in the index
     def search_meme_latest_status(self, meme_id: str):
-        try:
-            results = self.execute_query(queries.search_specific_meme_query(meme_id), mode = "search")[0]
-            return results[1], bool(results[2])
-        except IndexError:
-            return []
\ No newline at end of file
+        state = self.status_index.get(meme_id)
+        if state is not None:
+            return state.hours_elapsed, state.is_hot
+        results = self.execute_query(queries.SEARCH_SPECIFIC_MEME_QUERY, mode = "search",
+                                     params = (meme_id, meme_id))
+        if not results:
+            return
+        return results[0][1], bool(results[0][2])
\ No newline at end of file
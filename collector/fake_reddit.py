@@ -0,0 +1,176 @@
+# Local stand-in for the parts of praw.Reddit used by MemeStatsScraper,
+# replaying a recorded workload (the CSVs in Analysis/Sample Data) against a clock
+# Listings and info() return what was recorded for the current hour of each meme
+
+import bisect
+import csv
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+
+# Reddit's OAuth rate limit: requests per window, and the window length in seconds
+DEFAULT_REQUESTS_PER_WINDOW = 600
+DEFAULT_WINDOW_SECONDS = 600
+
+class RecordedMeme:
+    __slots__ = ("id", "title", "created", "url", "permalink", "scores", "comments", "hot_hours")
+
+    def __init__(self, meme_id: str, title: str, created: float, url: str, permalink: str):
+        self.id = meme_id
+        self.title = title
+        self.created = created
+        self.url = url
+        self.permalink = permalink
+        self.scores = []
+        self.comments = []
+        self.hot_hours = set()
+
+    # Index into the recorded series at "now", the last recorded value is kept afterwards
+    def hour_at(self, now: float):
+        return int((now - self.created) // 3600)
+
+class FakeSubmission:
+    __slots__ = ("id", "title", "score", "num_comments", "created", "url", "permalink",
+                 "stickied", "removed_by_category")
+
+    def __init__(self, meme: RecordedMeme, now: float, stickied: bool = False):
+        self.id = meme.id
+        self.title = meme.title
+        self.created = meme.created
+        self.url = meme.url
+        self.permalink = meme.permalink
+        hour = min(max(meme.hour_at(now), 0), len(meme.scores) - 1) if meme.scores else 0
+        self.score = meme.scores[hour] if meme.scores else 0
+        self.num_comments = meme.comments[hour] if meme.comments else 0
+        self.stickied = stickied
+        self.removed_by_category = None
+
+# Reads a recorded workload: meme_info plus the hourly score, comments and status tables
+def load_workload(data_dir: str):
+    memes = dict()
+    with open(os.path.join(data_dir, "meme_info.csv"), newline = "", encoding = "utf-8") as f:
+        for row in csv.DictReader(f):
+            created = datetime.strptime(row["creation_time"], "%Y-%m-%d %H:%M:%S").timestamp()
+            permalink = row["post_url"][len("reddit.com"):] if row["post_url"].startswith("reddit.com") else row["post_url"]
+            memes[row["meme_id"]] = RecordedMeme(row["meme_id"], row["title"], created, row["meme_url"], permalink)
+
+    for table_name, column in (("meme_score", "score"), ("meme_comments", "num_comments"), ("meme_status", "is_hot")):
+        with open(os.path.join(data_dir, f"{table_name}.csv"), newline = "", encoding = "utf-8") as f:
+            for row in csv.DictReader(f):
+                meme = memes.get(row["meme_id"])
+                if meme is None:
+                    continue
+                hour, value = int(row["hours_elapsed"]), int(row[column])
+                if column == "is_hot":
+                    if value:
+                        meme.hot_hours.add(hour)
+                    continue
+                series = meme.scores if column == "score" else meme.comments
+                # Fill hours missing from the recording with the previous value
+                while len(series) <= hour:
+                    series.append(series[-1] if series else 0)
+                series[hour] = value
+    return sorted(memes.values(), key = lambda meme: meme.created)
+
+class FakeAuth:
+
+    def __init__(self, reddit):
+        self.reddit = reddit
+
+    @property
+    def limits(self):
+        return self.reddit.current_limits()
+
+class FakeSubreddit:
+
+    def __init__(self, reddit, name: str):
+        self.reddit = reddit
+        self.name = name
+
+    # Stickied posts first, then the memes recorded as hot at this hour by score
+    def hot(self, limit: int = 100, params: dict = None):
+        now = self.reddit.clock()
+        listing = [FakeSubmission(sticky, now, stickied = True) for sticky in self.reddit.stickied]
+        hot_memes = [meme for meme in self.reddit.visible_memes(now) if meme.hour_at(now) in meme.hot_hours]
+        listing += sorted((FakeSubmission(meme, now) for meme in hot_memes), key = lambda meme: -meme.score)
+        after = (params or {}).get("after")
+        if after:
+            ids = [submission.id for submission in listing]
+            if after[3:] in ids:
+                listing = listing[ids.index(after[3:]) + 1:]
+        return self.reddit.listing(listing, limit)
+
+    # Newest first, only memes newer than "before" if given
+    def new(self, limit: int = 100, params: dict = None):
+        now = self.reddit.clock()
+        visible = self.reddit.visible_memes(now)
+        before = (params or {}).get("before")
+        if before and before[3:] in self.reddit.memes_by_id:
+            created = self.reddit.memes_by_id[before[3:]].created
+            visible = [meme for meme in visible if meme.created > created]
+        listing = [FakeSubmission(meme, now) for meme in reversed(visible)]
+        return self.reddit.listing(listing, limit)
+
+class FakeReddit:
+
+    def __init__(self, memes: list, clock, requests_per_window: int = DEFAULT_REQUESTS_PER_WINDOW,
+                 window_seconds: int = DEFAULT_WINDOW_SECONDS):
+        self.memes = memes
+        self.memes_by_id = {meme.id: meme for meme in memes}
+        self.created = [meme.created for meme in memes]
+        self.clock = clock
+        self.auth = FakeAuth(self)
+        self.stickied = [RecordedMeme(f"stick{i}", "Stickied post", memes[0].created - 86400, "", "")
+                         for i in (1, 2)]
+
+        # Rate limit accounting, shared with the update fetcher's threads
+        self.lock = threading.Lock()
+        self.requests_per_window = requests_per_window
+        self.window_seconds = window_seconds
+        self.window_start = None
+        self.used = 0
+        self.total_requests = 0
+        self.requests_per_hour = Counter()
+
+    def subreddit(self, name: str):
+        return FakeSubreddit(self, name)
+
+    def visible_memes(self, now: float):
+        return self.memes[:bisect.bisect_right(self.created, now)]
+
+    def count_request(self):
+        now = self.clock()
+        with self.lock:
+            window_start = now - now % self.window_seconds
+            if window_start != self.window_start:
+                self.window_start = window_start
+                self.used = 0
+            self.used += 1
+            self.total_requests += 1
+            self.requests_per_hour[int(now // 3600)] += 1
+
+    def current_limits(self):
+        now = self.clock()
+        with self.lock:
+            window_start = now - now % self.window_seconds
+            used = self.used if window_start == self.window_start else 0
+            return {"used": used, "remaining": max(self.requests_per_window - used, 0),
+                    "reset_timestamp": window_start + self.window_seconds}
+
+    # Like praw listings, one request per 100 items
+    def listing(self, submissions: list, limit: int = 100):
+        submissions = submissions[:limit if limit is not None else 100]
+        for start in range(0, max(len(submissions), 1), 100):
+            self.count_request()
+            yield from submissions[start:start + 100]
+
+    def info(self, fullnames: list):
+        now = self.clock()
+        fullnames = list(fullnames)
+        for start in range(0, len(fullnames), 100):
+            self.count_request()
+            for fullname in fullnames[start:start + 100]:
+                meme = self.memes_by_id.get(fullname[3:])
+                if meme is not None and meme.created <= now:
+                    yield FakeSubmission(meme, now)
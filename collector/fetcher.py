@@ -0,0 +1,114 @@
+import logging
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable
+from metrics import REGISTRY
+
+# Errors of Reddit requests, for except clauses
+# prawcore is always loaded once a praw client exists, so clients that
+# are not praw (e.g. the benchmark's fake Reddit) never import it
+def request_errors():
+    prawcore = sys.modules.get("prawcore")
+    return prawcore.exceptions.PrawcoreException if prawcore is not None else ()
+
+# Reddit's /api/info endpoint accepts at most 100 fullnames per request
+INFO_CHUNK_SIZE = 100
+
+# Results of a chunk that was not requested because the rate limit budget ran out,
+# the caller retries it once the window resets (see UpdateFetcher.reset_timestamp)
+DEFERRED = object()
+
+# Fetches submissions by id in chunks of INFO_CHUNK_SIZE on a bounded thread pool
+# "reddit" only needs info(fullnames) and auth.limits, so a local fake of the
+# info endpoint can be passed in place of a praw.Reddit instance
+# praw.Reddit is not thread-safe: with "client_factory" every worker gets a client of its own,
+# without it "reddit" is the only client and chunks are fetched one at a time
+class UpdateFetcher:
+
+    def __init__(self, reddit, max_workers: int = 4, chunk_size: int = INFO_CHUNK_SIZE,
+                 reserve_requests: int = 10, client_factory: Callable = None, clock: Callable = time.time):
+        self.reddit = reddit
+        self.client_factory = client_factory
+        self.max_workers = max_workers if client_factory is not None else 1
+        self.chunk_size = min(chunk_size, INFO_CHUNK_SIZE)
+        self.clock = clock
+        # Requests kept in hand, chunks are deferred to the next rate limit window past this
+        # Should be at least max_workers, since workers check the budget concurrently
+        self.reserve_requests = max(reserve_requests, max_workers)
+
+        # Clients not in use by a worker, created on demand and kept for later fetches
+        self.clients = [reddit]
+        self.idle_clients = queue.Queue()
+        self.idle_clients.put(reddit)
+        self.clients_lock = threading.Lock()
+
+    def __split_chunks(self, meme_ids: Iterable[str]):
+        meme_ids = list(meme_ids)
+        return [meme_ids[i:i + self.chunk_size] for i in range(0, len(meme_ids), self.chunk_size)]
+
+    def __acquire_client(self):
+        try:
+            return self.idle_clients.get(block = self.client_factory is None)
+        except queue.Empty:
+            client = self.client_factory()
+            with self.clients_lock:
+                self.clients.append(client)
+            return client
+
+    # Rate limits of the client that saw the latest response
+    # Clients share one budget, so within the current window the lowest "remaining" is the latest
+    # Once the window has reset, praw still holds the last response's limits until the next request,
+    # they are reported as unknown instead (the budget is replenished by then)
+    def limits(self):
+        now = self.clock()
+        with self.clients_lock:
+            clients = list(self.clients)
+        current = [limits for limits in (client.auth.limits for client in clients)
+                   if limits.get("remaining") is not None and limits.get("reset_timestamp") is not None
+                   and limits["reset_timestamp"] > now]
+        if not current:
+            return {"used": None, "remaining": None, "reset_timestamp": None}
+        return min(current, key = lambda limits: limits["remaining"])
+
+    # Timestamp the rate limit window resets at if the budget is used up, else None
+    def reset_timestamp(self):
+        rates = self.limits()
+        if rates.get("remaining") is None or rates.get("reset_timestamp") is None:
+            return
+        if rates["remaining"] > self.reserve_requests or rates["reset_timestamp"] <= self.clock():
+            return
+        return rates["reset_timestamp"]
+
+    def __fetch_chunk(self, meme_ids: list, formatter: Callable):
+        if self.reset_timestamp() is not None:
+            REGISTRY.increment("reddit_chunks_deferred_total")
+            return DEFERRED
+        client = self.__acquire_client()
+        try:
+            # info() is lazy, the request happens while the results are formatted
+            with REGISTRY.timer("reddit_request_seconds", call = "find_multi_specific"):
+                memes = client.info([f"t3_{meme_id}" for meme_id in meme_ids])
+                return [formatter(meme) for meme in memes]
+        finally:
+            self.idle_clients.put(client)
+
+    # Yields (chunk_ids, results) as soon as each chunk comes back, in completion order
+    # results is None if the request for that chunk failed, and DEFERRED if the
+    # rate limit budget ran out before it was requested
+    def fetch(self, meme_ids: Iterable[str], formatter: Callable):
+        chunks = self.__split_chunks(meme_ids)
+        if not chunks:
+            return
+        with ThreadPoolExecutor(max_workers = min(self.max_workers, len(chunks))) as executor:
+            futures = {executor.submit(self.__fetch_chunk, chunk, formatter): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                try:
+                    yield chunk, future.result()
+                except request_errors() as e:
+                    logging.warning(f"Error: {e}")
+                    logging.warning("Request from PRAW failed. Please check your connection.")
+                    yield chunk, None
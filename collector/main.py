@@ -1,6 +1,76 @@
-from collector import DataCollector
+# Command line entry point: python main.py [collect|export|analyze|bench] [options]
+# A command only imports what it needs once it is chosen, so "--help" and the commands
+# that do not talk to Reddit never load praw, and only "export" loads mysql.connector
+import time
+STARTED = time.perf_counter()
+
+import argparse
+import os
+import sys
+
+ANALYSIS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Analysis")
+
+# Cold start (imports and argument parsing, after the interpreter is up) of the
+# commands that do not collect should stay under this, check with --startup-time
+STARTUP_TARGET_SECONDS = 1.0
+
+# Each command parses its options, imports its dependencies and returns the work to run
+def collect(argv: list):
+    from config import USER_PARAMS
+    COLLECTION = USER_PARAMS["collection"]
+    parser = argparse.ArgumentParser(prog = "main.py collect", description = "Collect memes into the database")
+    parser.add_argument("--database", default = COLLECTION["DATABASE-NAME"])
+    parser.add_argument("--collect-new-hours", type = float, default = COLLECTION["COLLECT-NEW-HOURS"])
+    parser.add_argument("--update-hours", type = int, default = COLLECTION["UPDATE-HOURS"])
+    parser.add_argument("--failsafe", action = "store_true", help = "stop updating memes whose update failed")
+    parser.add_argument("--shards", type = int, default = 0, help = "collect with this many worker processes")
+    args = parser.parse_args(argv)
+
+    if args.shards:
+        from sharding import launch_shards
+        return lambda: launch_shards(args.shards, args.database, args.collect_new_hours,
+                                     args.update_hours, args.failsafe)
+
+    from collector import DataCollector, configure_logging
+    def run():
+        configure_logging()
+        collector = DataCollector()
+        collector.prepare_database(args.database)
+        collector.run(args.collect_new_hours, args.update_hours, args.failsafe)
+    return run
+
+def export(argv: list):
+    import data_retriever
+    return lambda: data_retriever.main(argv, prog = "main.py export")
+
+def analyze(argv: list):
+    sys.path.append(ANALYSIS_DIR)
+    import meme_analysis
+    return lambda: meme_analysis.main(argv, prog = "main.py analyze")
+
+def bench(argv: list):
+    import benchmark
+    return lambda: benchmark.main(argv, prog = "main.py bench")
+
+COMMANDS = {"collect": collect, "export": export, "analyze": analyze, "bench": bench}
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description = "Reddit meme collector. Options of a command: main.py COMMAND --help")
+    parser.add_argument("--startup-time", action = "store_true",
+                        help = "only start the command and print the time it took")
+    parser.add_argument("command", nargs = "?", choices = COMMANDS, default = "collect")
+    parser.add_argument("options", nargs = argparse.REMAINDER)
+    args = parser.parse_args(argv)
+
+    run = COMMANDS[args.command](args.options)
+    startup = time.perf_counter() - STARTED
+    if args.startup_time:
+        print(f"{args.command} started in {startup:.3f}s")
+        if args.command != "collect" and startup > STARTUP_TARGET_SECONDS:
+            print(f"Startup is over the {STARTUP_TARGET_SECONDS}s target")
+            sys.exit(1)
+        return
+    run()
 
 if __name__ == "__main__":
-    collector = DataCollector()
-    collector.prepare_database("memes0625")
-    collector.run()
\ No newline at end of file
+    main()
@@ -0,0 +1,37 @@
+# In-process index of the latest status (hours_elapsed, is_hot) of each meme
+# The collector is the only writer of meme_status, so keeping this index current
+# as rows are written replaces the per-meme MAX(hours_elapsed) lookup in the database
+
+class MemeState:
+    __slots__ = ("hours_elapsed", "is_hot")
+
+    def __init__(self, hours_elapsed: int, is_hot: bool):
+        self.hours_elapsed = hours_elapsed
+        self.is_hot = is_hot
+
+class MemeStateIndex:
+
+    def __init__(self):
+        self.states = dict()
+
+    def __len__(self):
+        return len(self.states)
+
+    def __contains__(self, meme_id: str):
+        return meme_id in self.states
+
+    # Only moves forward in time, older rows never overwrite a newer state
+    def update(self, meme_id: str, hours_elapsed: int, is_hot: bool):
+        state = self.states.get(meme_id)
+        if state is None:
+            self.states[meme_id] = MemeState(hours_elapsed, bool(is_hot))
+        elif hours_elapsed >= state.hours_elapsed:
+            state.hours_elapsed = hours_elapsed
+            state.is_hot = bool(is_hot)
+
+    def get(self, meme_id: str):
+        return self.states.get(meme_id)
+
+    # Drop memes that are no longer tracked to keep the index compact
+    def remove(self, meme_id: str):
+        self.states.pop(meme_id, None)
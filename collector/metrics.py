@@ -0,0 +1,152 @@
+# Lightweight metrics for the collector: timing histograms, counters and gauges,
+# exported as Prometheus text (over HTTP) or as a JSON snapshot file
+
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Upper bounds (seconds) of the timing histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count", "max")
+
+    def __init__(self, buckets: tuple = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+        self.max = max(self.max, value)
+
+def _label_key(labels: dict):
+    return tuple(sorted(labels.items()))
+
+def _format_labels(key: tuple, extra: dict = None):
+    items = list(key) + list((extra or {}).items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in items) + "}"
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = dict()
+        self.counters = dict()
+        self.gauges = dict()
+        self.server = None
+
+    def observe(self, name: str, value: float, **labels):
+        with self.lock:
+            series = self.histograms.setdefault(name, dict())
+            histogram = series.get(_label_key(labels))
+            if histogram is None:
+                histogram = series[_label_key(labels)] = Histogram()
+            histogram.observe(value)
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        with self.lock:
+            series = self.counters.setdefault(name, dict())
+            key = _label_key(labels)
+            series[key] = series.get(key, 0) + amount
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self.lock:
+            self.gauges.setdefault(name, dict())[_label_key(labels)] = value
+
+    # Observes the duration of the block in histogram "name"
+    @contextmanager
+    def timer(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    # Decorator version of timer
+    def timed(self, name: str, **labels):
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def to_prometheus(self):
+        lines = []
+        with self.lock:
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(key, {'le': bound})} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(key)} {histogram.total}")
+                    lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+            for kind, metrics in (("counter", self.counters), ("gauge", self.gauges)):
+                for name, series in sorted(metrics.items()):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for key, value in series.items():
+                        lines.append(f"{name}{_format_labels(key)} {value}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self):
+        def labelled(series, to_value):
+            return [{"labels": dict(key), "value": to_value(value)} for key, value in series.items()]
+        with self.lock:
+            return {
+                "timestamp": time.time(),
+                "histograms": {name: labelled(series, lambda h: {
+                    "count": h.count, "sum": h.total, "max": h.max,
+                    "buckets": dict(zip([str(bound) for bound in h.buckets] + ["+Inf"], h.counts)),
+                }) for name, series in self.histograms.items()},
+                "counters": {name: labelled(series, lambda v: v) for name, series in self.counters.items()},
+                "gauges": {name: labelled(series, lambda v: v) for name, series in self.gauges.items()},
+            }
+
+    # Written to a temporary file first so readers never see a partial snapshot
+    def write_snapshot(self, path: str):
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w", encoding = "utf-8") as f:
+            f.write(json.dumps(self.snapshot(), separators = (",", ":")))
+        os.replace(temporary_path, path)
+
+    # Serves the Prometheus text format on http://host:port/metrics from a daemon thread
+    # Only reachable from this machine unless another "host" (e.g. "0.0.0.0") is given
+    def serve(self, port: int, host: str = "127.0.0.1"):
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip("/") != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target = self.server.serve_forever, name = "metrics", daemon = True).start()
+        return self.server
+
+# Registry shared by the whole collector process
+REGISTRY = MetricsRegistry()
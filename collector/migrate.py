@@ -0,0 +1,58 @@
+# Converts a database from the "tables" schema to the compact "snapshot" schema
+# meme_score, meme_comments and meme_status are merged into meme_snapshot with one bulk
+# INSERT ... SELECT, then replaced by read-only views of the same names.
+# The old tables are kept as <name>_old unless --drop-old is given
+# Stop the collector writing to the database before migrating it
+
+import argparse
+import queries
+from backends import configured_backend
+from database import DatabaseHelper
+
+HOURLY_TABLES = ("meme_score", "meme_comments", "meme_status")
+
+def count_rows(dbhelper: DatabaseHelper, table_name: str):
+    return (dbhelper.execute_query(f"SELECT COUNT(*) FROM {table_name};", mode = "search") or [(None,)])[0][0]
+
+# Returns True once the current database of "dbhelper" uses the snapshot schema
+def migrate_to_snapshot(dbhelper: DatabaseHelper, drop_old: bool = False):
+    schema = dbhelper.detect_schema()
+    if schema == "snapshot":
+        print(f"{dbhelper.current_database} already uses the snapshot schema")
+        return True
+    if schema is None:
+        print(f"{dbhelper.current_database} has no tables to migrate")
+        return False
+
+    print(f"Merging {', '.join(HOURLY_TABLES)} into meme_snapshot...")
+    dbhelper.execute_query(queries.MEME_SNAPSHOT_CREATION_QUERY, mode = "create")
+    dbhelper.execute_query(queries.MIGRATE_TO_SNAPSHOT_QUERY)
+    # The old tables stay in place if anything went wrong
+    num_rows = count_rows(dbhelper, "meme_snapshot")
+    if num_rows is None or num_rows != count_rows(dbhelper, "meme_score"):
+        print("Migration failed, meme_snapshot does not match meme_score. Old tables were left untouched")
+        dbhelper.execute_query("DROP TABLE meme_snapshot;", mode = "create")
+        return False
+
+    for table_name in HOURLY_TABLES:
+        dbhelper.execute_query(f"ALTER TABLE {table_name} RENAME TO {table_name}_old;", mode = "create")
+        dbhelper.execute_query(queries.SNAPSHOT_VIEW_QUERIES[table_name], mode = "create")
+        if drop_old:
+            dbhelper.execute_query(f"DROP TABLE {table_name}_old;", mode = "create")
+    dbhelper.create_indexes()
+    dbhelper.schema = "snapshot"
+    print(f"Migrated {num_rows} hourly updates to meme_snapshot")
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Convert a database to the compact meme_snapshot schema")
+    parser.add_argument("database", help = "name of the database to migrate")
+    parser.add_argument("--drop-old", action = "store_true",
+                        help = "drop the old tables instead of keeping them as <name>_old")
+    args = parser.parse_args()
+
+    dbhelper = DatabaseHelper(backend = configured_backend())
+    dbhelper.connect_server()
+    assert dbhelper.database_exists(args.database), f"Database {args.database} does not exist"
+    dbhelper.connect_database(args.database)
+    migrate_to_snapshot(dbhelper, args.drop_old)
@@ -0,0 +1,104 @@
+# Producer/consumer pipeline between Reddit fetches and database writes
+# Fetch stages submit write jobs to a bounded queue, writer threads drain it.
+# A full queue blocks the submitting fetch stage (backpressure) instead of growing without bound.
+
+import logging
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+from metrics import REGISTRY
+
+class StageMetrics:
+    __slots__ = ("count", "total_seconds", "max_seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def record(self, seconds: float):
+        self.count += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    @property
+    def average_seconds(self):
+        return self.total_seconds / self.count if self.count else 0.0
+
+class CollectionPipeline:
+
+    def __init__(self, num_writers: int = 1, max_queue_size: int = 100):
+        self.queue = queue.Queue(maxsize = max_queue_size)
+        self.num_writers = num_writers
+        self.writers = []
+        self.metrics_lock = threading.Lock()
+        # fetch: time spent waiting on Reddit, queued: time a job waited for a writer,
+        # write: time a writer spent on a job
+        self.metrics = {stage: StageMetrics() for stage in ("fetch", "queued", "write")}
+        self.max_queue_depth = 0
+
+    def start(self):
+        for i in range(self.num_writers):
+            writer = threading.Thread(target = self.__drain, name = f"writer-{i}", daemon = True)
+            writer.start()
+            self.writers.append(writer)
+
+    # Waits for every submitted job to be written, then stops the writers
+    def stop(self):
+        self.queue.join()
+        for _ in self.writers:
+            self.queue.put(None)
+        for writer in self.writers:
+            writer.join()
+        self.writers = []
+
+    def record(self, stage: str, seconds: float):
+        with self.metrics_lock:
+            self.metrics[stage].record(seconds)
+        REGISTRY.observe("pipeline_stage_seconds", seconds, stage = stage)
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    # Queues func(*args) for a writer, blocks while the queue is full
+    # Without writers (pipeline not started) the job runs inline
+    def submit(self, func: Callable, *args):
+        if not self.writers:
+            with self.stage("write"):
+                func(*args)
+            return
+        self.queue.put((func, args, time.perf_counter()))
+        with self.metrics_lock:
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        REGISTRY.set_gauge("pipeline_queue_depth", self.queue.qsize())
+
+    def __drain(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                self.queue.task_done()
+                return
+            func, args, queued_at = job
+            self.record("queued", time.perf_counter() - queued_at)
+            try:
+                with self.stage("write"):
+                    func(*args)
+            except Exception:
+                logging.exception(f"Write job {func.__name__} failed")
+            finally:
+                self.queue.task_done()
+
+    def report(self):
+        with self.metrics_lock:
+            stages = ", ".join(
+                f"{name}: {metrics.count} jobs avg {metrics.average_seconds * 1000:.1f}ms max {metrics.max_seconds * 1000:.1f}ms"
+                for name, metrics in self.metrics.items()
+            )
+            return f"Pipeline: {stages}, queue depth: {self.queue.qsize()} (max {self.max_queue_depth})"
@@ -0,0 +1,79 @@
+# Per-meme polling cadence for the hourly update buckets
+# A meme is polled on every tick of its bucket while it is young, moving fast or close to hot,
+# and on every 2nd, 4th, ... tick as its score flattens out. Rows are keyed by whole
+# hours_elapsed, so one hour is the shortest interval and a slow meme just skips hours.
+
+import threading
+
+class PollState:
+    __slots__ = ("hours_elapsed", "score", "num_comments", "interval", "ticks_to_skip")
+
+    def __init__(self, hours_elapsed: int, score: int, num_comments: int):
+        self.hours_elapsed = hours_elapsed
+        self.score = score
+        self.num_comments = num_comments
+        self.interval = 1
+        self.ticks_to_skip = 0
+
+class PollingCadence:
+
+    # "max_interval" of 1 polls every meme every hour
+    def __init__(self, max_interval: int = 4, young_hours: int = 3, fast_score_velocity: float = 50,
+                 fast_comment_velocity: float = 10, slow_score_velocity: float = 5, hot_proximity: float = 0.5):
+        self.max_interval = max_interval
+        self.young_hours = young_hours
+        self.fast_score_velocity = fast_score_velocity
+        self.fast_comment_velocity = fast_comment_velocity
+        self.slow_score_velocity = slow_score_velocity
+        self.hot_proximity = hot_proximity
+        # Lowest score currently in hot, set by the hot collection
+        self.hot_threshold = None
+        self.states = dict()
+        # Ticks come from the scheduler thread, polls are recorded on pipeline writers
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.states)
+
+    # Memes of "meme_ids" to poll on this tick of their bucket, the others count down a tick
+    def due(self, meme_ids: list):
+        due_ids = []
+        with self.lock:
+            for meme_id in meme_ids:
+                state = self.states.get(meme_id)
+                if state is None or state.ticks_to_skip <= 0:
+                    due_ids.append(meme_id)
+                else:
+                    state.ticks_to_skip -= 1
+        return due_ids
+
+    def __next_interval(self, state: PollState, hours_elapsed: int, score: int, num_comments: int):
+        if state is None or hours_elapsed < self.young_hours:
+            return 1
+        hours = max(hours_elapsed - state.hours_elapsed, 1)
+        score_velocity = (score - state.score) / hours
+        comment_velocity = (num_comments - state.num_comments) / hours
+        near_hot = self.hot_threshold is not None and score >= self.hot_threshold * self.hot_proximity
+        if near_hot or score_velocity >= self.fast_score_velocity or comment_velocity >= self.fast_comment_velocity:
+            return 1
+        if score_velocity < self.slow_score_velocity:
+            return min(state.interval * 2, self.max_interval)
+        return state.interval
+
+    # Records a poll and returns the meme's next interval in hours
+    # The interval never skips past "update_hours", so the last reading is always taken
+    def record(self, meme_id: str, hours_elapsed: int, score: int, num_comments: int, update_hours: int):
+        with self.lock:
+            state = self.states.get(meme_id)
+            interval = self.__next_interval(state, hours_elapsed, score, num_comments)
+            interval = max(min(interval, update_hours - hours_elapsed), 1)
+            if state is None:
+                state = self.states[meme_id] = PollState(hours_elapsed, score, num_comments)
+            state.hours_elapsed, state.score, state.num_comments = hours_elapsed, score, num_comments
+            state.interval = interval
+            state.ticks_to_skip = interval - 1
+            return interval
+
+    def remove(self, meme_id: str):
+        with self.lock:
+            self.states.pop(meme_id, None)
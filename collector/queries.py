@@ -44,47 +44,224 @@ MEME_STATUS_CREATION_QUERY = """
     );
     """
 
+# Compact schema: one row per hourly update instead of one row in each of the three tables above
+MEME_SNAPSHOT_CREATION_QUERY = """
+    CREATE TABLE IF NOT EXISTS meme_snapshot
+    (
+        meme_id VARCHAR(6) NOT NULL,
+        hours_elapsed INT NOT NULL,
+        score INT NOT NULL,
+        num_comments INT NOT NULL,
+        is_hot BOOLEAN NOT NULL,
+        PRIMARY KEY (meme_id, hours_elapsed),
+        FOREIGN KEY (meme_id) REFERENCES meme_info(meme_id)
+    );
+    """
+
+# Read-only views under the old table names, so existing queries and exports keep working
+SNAPSHOT_VIEW_QUERIES = {
+    "meme_score": """
+    CREATE VIEW meme_score AS
+    SELECT meme_id, hours_elapsed, score
+    FROM meme_snapshot;
+    """,
+    "meme_comments": """
+    CREATE VIEW meme_comments AS
+    SELECT meme_id, hours_elapsed, num_comments
+    FROM meme_snapshot;
+    """,
+    "meme_status": """
+    CREATE VIEW meme_status AS
+    SELECT meme_id, hours_elapsed, is_hot
+    FROM meme_snapshot;
+    """,
+}
+
+# Resuming, sharding and new collection look memes up by creation_time
+# (TRACKED_MEMES_QUERY runs every minute on every worker of a sharded run)
+MEME_INFO_CREATION_TIME_INDEX_QUERY = """
+    CREATE INDEX meme_info_creation_time ON meme_info (creation_time);
+    """
+
+# Bulk conversion of the three hourly tables, every update writes a row to each of them
+MIGRATE_TO_SNAPSHOT_QUERY = """
+    INSERT INTO meme_snapshot
+    (meme_id, hours_elapsed, score, num_comments, is_hot)
+    SELECT s.meme_id, s.hours_elapsed, s.score, COALESCE(c.num_comments, 0), COALESCE(st.is_hot, FALSE)
+    FROM meme_score s
+    LEFT JOIN meme_comments c
+    ON c.meme_id = s.meme_id
+    AND c.hours_elapsed = s.hours_elapsed
+    LEFT JOIN meme_status st
+    ON st.meme_id = s.meme_id
+    AND st.hours_elapsed = s.hours_elapsed;
+    """
+
 SHOW_ALL_DATABASES_QUERY = "SHOW DATABASES;"
 
 SHOW_ALL_TABLES_QUERY = "SHOW TABLES;"
 
-# Helper function for values of types bool, string and int to ideal formats needed in a SQL query
-def __process_value_to_sql_format(value):
-    if type(value) == str:
-        value = value.replace("'", "''")
-        return f"'{value}'"
-    if type(value) == int:
-        return str(value)
-    if value:
-        return "true"
-    if not value:
-        return "false"
-    return
-
 def database_creation_query(database_name: str):
     return f"CREATE DATABASE {database_name}"
 
-def insert_query(table_name: str, *values):
-    values = (__process_value_to_sql_format(value) for value in values) 
+# Parameterized insert used for batched writes (executemany), 
+# values are passed separately so no manual escaping is needed
+def insert_many_query(table_name: str, num_values: int):
+    placeholders = ", ".join(["%s"] * num_values)
     return f"""
     INSERT INTO {table_name}
-    VALUES ({", ".join(values)});
+    VALUES ({placeholders});
+    """
+
+# Memes created since a given time that are still being updated, with their latest status
+TRACKED_MEMES_QUERY = """
+    SELECT i.meme_id, i.creation_time, s.hours_elapsed, s.is_hot
+    FROM meme_info i
+    JOIN (SELECT ls.meme_id, MAX(ls.hours_elapsed) AS hours_elapsed
+          FROM meme_status ls
+          JOIN meme_info li ON ls.meme_id = li.meme_id
+          WHERE li.creation_time >= %s
+          GROUP BY ls.meme_id) latest
+    ON i.meme_id = latest.meme_id
+    JOIN meme_status s
+    ON s.meme_id = latest.meme_id
+    AND s.hours_elapsed = latest.hours_elapsed
+    WHERE s.hours_elapsed < %s;
+    """
+
+NEWEST_MEMES_QUERY = """
+    SELECT meme_id
+    FROM meme_info
+    ORDER BY creation_time DESC
+    LIMIT %s;
+    """
+
+# Collector processes of a sharded run, each with the time of its last heartbeat
+COLLECTOR_WORKERS_CREATION_QUERY = """
+    CREATE TABLE IF NOT EXISTS collector_workers
+    (
+        worker_id VARCHAR(64) NOT NULL,
+        last_heartbeat DOUBLE NOT NULL,
+        PRIMARY KEY (worker_id)
+    );
+    """
+
+LIVE_WORKERS_QUERY = """
+    SELECT worker_id
+    FROM collector_workers
+    WHERE last_heartbeat >= %s
+    ORDER BY worker_id;
     """
-# Updating happens only when a meme has entered hot, 
+
+# Rollups kept current by DatabaseHelper.flush, see summaries.py
+# Latest score and comments (each with the hour it was recorded at), peak score and first hour in hot of each meme
+MEME_SUMMARY_CREATION_QUERY = """
+    CREATE TABLE IF NOT EXISTS meme_summary
+    (
+        meme_id VARCHAR(6) NOT NULL,
+        latest_hour INT,
+        latest_score INT,
+        peak_score INT,
+        peak_hour INT,
+        comments_hour INT,
+        latest_comments INT,
+        first_hot_hour INT,
+        PRIMARY KEY (meme_id),
+        FOREIGN KEY (meme_id) REFERENCES meme_info(meme_id)
+    );
+    """
+
+# Totals over all memes for each hours_elapsed
+HOURLY_SUMMARY_CREATION_QUERY = """
+    CREATE TABLE IF NOT EXISTS hourly_summary
+    (
+        hours_elapsed INT NOT NULL,
+        num_memes INT NOT NULL,
+        total_score BIGINT NOT NULL,
+        total_comments BIGINT NOT NULL,
+        num_hot INT NOT NULL,
+        PRIMARY KEY (hours_elapsed)
+    );
+    """
+
+# One-time fill of the rollups for a database collected before they existed
+MEME_SUMMARY_BACKFILL_QUERY = """
+    INSERT INTO meme_summary
+    (meme_id, latest_hour, latest_score, peak_score, peak_hour, comments_hour, latest_comments, first_hot_hour)
+    SELECT i.meme_id,
+           s.latest_hour,
+           (SELECT ls.score FROM meme_score ls
+            WHERE ls.meme_id = i.meme_id AND ls.hours_elapsed = s.latest_hour),
+           s.peak_score,
+           (SELECT MIN(ps.hours_elapsed) FROM meme_score ps
+            WHERE ps.meme_id = i.meme_id AND ps.score = s.peak_score),
+           c.comments_hour,
+           (SELECT lc.num_comments FROM meme_comments lc
+            WHERE lc.meme_id = i.meme_id AND lc.hours_elapsed = c.comments_hour),
+           (SELECT MIN(hs.hours_elapsed) FROM meme_status hs
+            WHERE hs.meme_id = i.meme_id AND hs.is_hot)
+    FROM meme_info i
+    LEFT JOIN (SELECT meme_id, MAX(hours_elapsed) AS latest_hour, MAX(score) AS peak_score
+               FROM meme_score
+               GROUP BY meme_id) s
+    ON s.meme_id = i.meme_id
+    LEFT JOIN (SELECT meme_id, MAX(hours_elapsed) AS comments_hour
+               FROM meme_comments
+               GROUP BY meme_id) c
+    ON c.meme_id = i.meme_id
+    WHERE s.meme_id IS NOT NULL
+    OR c.meme_id IS NOT NULL;
+    """
+
+HOURLY_SUMMARY_BACKFILL_QUERY = """
+    INSERT INTO hourly_summary
+    (hours_elapsed, num_memes, total_score, total_comments, num_hot)
+    SELECT s.hours_elapsed, s.num_memes, s.total_score,
+           COALESCE(c.total_comments, 0), COALESCE(h.num_hot, 0)
+    FROM (SELECT hours_elapsed, COUNT(*) AS num_memes, SUM(score) AS total_score
+          FROM meme_score
+          GROUP BY hours_elapsed) s
+    LEFT JOIN (SELECT hours_elapsed, SUM(num_comments) AS total_comments
+               FROM meme_comments
+               GROUP BY hours_elapsed) c
+    ON c.hours_elapsed = s.hours_elapsed
+    LEFT JOIN (SELECT hours_elapsed, SUM(CASE WHEN is_hot THEN 1 ELSE 0 END) AS num_hot
+               FROM meme_status
+               GROUP BY hours_elapsed) h
+    ON h.hours_elapsed = s.hours_elapsed;
+    """
+
+SUMMARY_NEEDS_BACKFILL_QUERY = """
+    SELECT NOT EXISTS (SELECT 1 FROM meme_summary)
+    AND EXISTS (SELECT 1 FROM meme_score);
+    """
+
+MEME_SUMMARY_QUERY = """
+    SELECT latest_hour, latest_score, peak_score, peak_hour, comments_hour, latest_comments, first_hot_hour
+    FROM meme_summary
+    WHERE meme_id = %s;
+    """
+
+HOURLY_SUMMARY_QUERY = """
+    SELECT hours_elapsed, num_memes, total_score, total_comments, num_hot
+    FROM hourly_summary
+    ORDER BY hours_elapsed;
+    """
+
+# Run as prepared statements
+# Updating happens only when a meme has entered hot,
 # and only the "entered_hot" value of "meme_info" table has to be changed
-def update_meme_info_query(meme_id: str, entered_hot: bool):
-    return f"""
+UPDATE_MEME_INFO_QUERY = """
     UPDATE meme_info
-    SET entered_hot = {entered_hot}
-    WHERE meme_id = '{meme_id}';
+    SET entered_hot = %s
+    WHERE meme_id = %s;
     """
 
-def search_specific_meme_query(meme_id: str):
-    return f"""
+SEARCH_SPECIFIC_MEME_QUERY = """
     SELECT *
     FROM meme_status
-    WHERE meme_id = '{meme_id}' 
-    AND hours_elapsed = (SELECT MAX(hours_elapsed) 
-						 FROM meme_status
-                         WHERE meme_id = '{meme_id}');
+    WHERE meme_id = %s
+    AND hours_elapsed = (SELECT MAX(hours_elapsed)
+                         FROM meme_status
+                         WHERE meme_id = %s);
     """
\ No newline at end of file
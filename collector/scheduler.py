@@ -0,0 +1,202 @@
+# Priority-queue scheduler used by DataCollector in place of the "schedule" package
+# Sleeps until the next due task instead of polling, spaces tasks out over the
+# current rate limit window, and defers low priority tasks when quota runs low
+# Tasks of different groups (e.g. subreddits) get a fair share of each window
+
+import heapq
+import itertools
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Callable
+
+# Lower value runs first when tasks are due at the same time, and is deferred last
+# Missing an update slot loses data, missing a hot check only delays is_hot,
+# and new collection is cursor based so a deferred run catches up on the next one
+PRIORITY_UPDATE = 0
+PRIORITY_HOT = 1
+PRIORITY_NEW = 2
+
+# Shortest deferral of a task held back by the rate limits, so a reset that is (nearly) due
+# never makes the task come back right away and spin on the same check
+MIN_DEFERRAL_SECONDS = 30
+
+# praw sets reset_timestamp to the time of each response plus Reddit's whole seconds to reset,
+# so within one window it drifts by a second or so from request to request
+WINDOW_RESET_TOLERANCE = 5
+
+class ScheduledTask:
+    __slots__ = ("due", "priority", "interval", "until", "func", "args", "tags", "group", "cancelled")
+
+    def __init__(self, due: float, priority: int, interval: float, until: float,
+                 func: Callable, args: tuple, tags: tuple, group: str):
+        self.due = due
+        self.priority = priority
+        self.interval = interval
+        self.until = until
+        self.func = func
+        self.args = args
+        self.tags = tags
+        self.group = group
+        self.cancelled = False
+
+class AdaptiveScheduler:
+
+    def __init__(self, rate_limits: Callable = None, low_quota: int = 50,
+                 clock: Callable = time.time, sleep: Callable = time.sleep):
+        # rate_limits returns a dict like praw's reddit.auth.limits
+        self.rate_limits = rate_limits
+        self.low_quota = low_quota
+        self.clock = clock
+        self.sleep = sleep
+        self.queue = []
+        self.counter = itertools.count()
+        self.last_run = None
+
+        # Requests used by each group in the current rate limit window
+        self.group_usage = Counter()
+        # reset_timestamp of that window when it was first seen, and its latest "used"
+        self.usage_window = None
+        self.usage_window_used = None
+
+    def __push(self, task: ScheduledTask):
+        heapq.heappush(self.queue, (task.due, task.priority, next(self.counter), task))
+
+    # Schedule func(*args) at "start" (default: now), repeated every "interval" seconds
+    # until the timestamp "until" if given
+    # Deferrable tasks with a "group" are held to an even share of the window between groups
+    def schedule(self, func: Callable, *args, start: float = None, interval: float = None,
+                 until: float = None, priority: int = PRIORITY_UPDATE, tags: tuple = (), group: str = None):
+        due = self.clock() if start is None else start
+        task = ScheduledTask(due, priority, interval, until, func, args, tags, group)
+        self.__push(task)
+        return task
+
+    def cancel(self, task: ScheduledTask):
+        # Cancelled tasks are dropped lazily when they reach the top of the queue
+        task.cancelled = True
+
+    def get_tasks(self, tag: str = None):
+        return [entry[3] for entry in self.queue
+                if not entry[3].cancelled and (tag is None or tag in entry[3].tags)]
+
+    # Timestamp of the next occurrence of minute ":MM" of an hour, after now
+    def next_minute_of_hour(self, minute_string: str):
+        now = self.clock()
+        next_time = datetime.fromtimestamp(now).replace(minute = int(minute_string[1:]), second = 0, microsecond = 0)
+        if next_time.timestamp() <= now:
+            next_time += timedelta(hours = 1)
+        return next_time.timestamp()
+
+    # Returns (remaining, seconds until reset), or None when limits are unknown
+    # Limits of a window that has already reset are stale, the budget is replenished
+    def __current_quota(self):
+        if self.rate_limits is None:
+            return
+        rates = self.rate_limits()
+        if rates.get("remaining") is None or rates.get("reset_timestamp") is None:
+            return
+        seconds_to_reset = rates["reset_timestamp"] - self.clock()
+        if seconds_to_reset <= 0:
+            return
+        return rates["remaining"], seconds_to_reset
+
+    # Requests used so far in the current window, counters restart with every window
+    # A new window shows as "used" going down or the reset moving past the drift of one window
+    def __window_used(self):
+        if self.rate_limits is None:
+            return
+        rates = self.rate_limits()
+        if rates.get("used") is None or rates.get("reset_timestamp") is None:
+            return
+        if (self.usage_window is None or rates["used"] < self.usage_window_used
+                or rates["reset_timestamp"] > self.usage_window + WINDOW_RESET_TOLERANCE):
+            self.usage_window = rates["reset_timestamp"]
+            self.group_usage.clear()
+        self.usage_window_used = rates["used"]
+        return rates["used"]
+
+    # Whether "task"'s group already used its share of the window, out of the groups that have tasks
+    def __over_fair_share(self, task: ScheduledTask, quota):
+        if task.group is None or task.priority == PRIORITY_UPDATE or quota is None:
+            return False
+        used = self.__window_used()
+        if used is None:
+            return False
+        groups = {entry[3].group for entry in self.queue if not entry[3].cancelled and entry[3].group is not None}
+        groups.add(task.group)
+        return self.group_usage[task.group] >= (used + quota[0]) / len(groups)
+
+    # Spreads the remaining requests evenly across what is left of the window
+    def __pacing_delay(self, quota):
+        if quota is None or self.last_run is None:
+            return 0
+        remaining, seconds_to_reset = quota
+        spacing = seconds_to_reset / max(remaining, 1)
+        return max(self.last_run + spacing - self.clock(), 0)
+
+    # A task that ran late (deferred, or blocked by a long task) skips the slots it missed,
+    # catching up back to back would spend the budget the pacing is there to protect
+    def __reschedule(self, task: ScheduledTask):
+        if task.interval is None:
+            return
+        task.due += task.interval
+        now = self.clock()
+        if task.due <= now:
+            missed = int((now - task.due) // task.interval) + 1
+            task.due += missed * task.interval
+            logging.info(f"{task.func.__name__} ran late, skipping {missed} missed run(s)")
+        if task.until is not None and task.due > task.until:
+            return
+        self.__push(task)
+
+    # Waits for and runs the next due task, returns False when there is nothing left
+    def run_next(self):
+        while self.queue and self.queue[0][3].cancelled:
+            heapq.heappop(self.queue)
+        if not self.queue:
+            return False
+
+        due, _, _, task = self.queue[0]
+        wait = due - self.clock()
+        if wait > 0:
+            self.sleep(wait)
+            # A task may have been added while sleeping, decide again
+            return True
+        heapq.heappop(self.queue)
+
+        quota = self.__current_quota()
+        if quota is not None and quota[0] < self.low_quota and task.priority > PRIORITY_UPDATE:
+            remaining, seconds_to_reset = quota
+            delay = max(seconds_to_reset, MIN_DEFERRAL_SECONDS)
+            logging.info(f"Only {remaining} requests remaining, deferring {task.func.__name__} by {delay:.0f}s")
+            task.due = self.clock() + delay
+            self.__push(task)
+            return True
+        if self.__over_fair_share(task, quota):
+            delay = max(quota[1], MIN_DEFERRAL_SECONDS)
+            logging.info(f"{task.group} used its share of this window, deferring {task.func.__name__} by {delay:.0f}s")
+            task.due = self.clock() + delay
+            self.__push(task)
+            return True
+
+        delay = self.__pacing_delay(quota)
+        if delay > 0:
+            self.sleep(delay)
+
+        self.last_run = self.clock()
+        used_before = self.__window_used() if task.group is not None else None
+        task.func(*task.args)
+        used_after = self.__window_used() if used_before is not None else None
+        if used_after is not None:
+            # A window reset during the task counts everything used since
+            self.group_usage[task.group] += used_after - used_before if used_after >= used_before else used_after
+        if not task.cancelled:
+            self.__reschedule(task)
+        return True
+
+    # Runs tasks until "keep_running" returns False or the queue is empty
+    def run(self, keep_running: Callable = lambda: True):
+        while keep_running() and self.run_next():
+            pass
@@ -1,17 +1,40 @@
 from types import GeneratorType
-from typing import Iterable, Union
-import praw
+from typing import Callable, Iterable, Union
 import os
 import logging
+import time
 from datetime import datetime
-from prawcore.exceptions import PrawcoreException, NotFound
+from fetcher import UpdateFetcher, DEFERRED, request_errors
+from metrics import REGISTRY
+
+# A subreddit can have at most two stickied posts
+MAX_STICKIED_POSTS = 2
+# Items per listing request, praw pages larger limits over several requests
+LISTING_PAGE_SIZE = 100
 
 class MemeStatsScraper:
 
-    def __init__(self, user_agent: str, client_id: str, client_secret: str):
-        self.reddit = praw.Reddit(user_agent = user_agent,
-                                  client_id = client_id,
-                                  client_secret = client_secret)
+    # A ready-made "reddit" client (e.g. a local fake for benchmarks) can be passed instead of credentials
+    # New memes of all "subreddits" come from one merged listing, hot is looked up per subreddit
+    def __init__(self, user_agent: str = None, client_id: str = None, client_secret: str = None,
+                 fetch_workers: int = 4, reddit = None, subreddits: Iterable[str] = ("memes",),
+                 clock: Callable = time.time):
+        client_factory = None
+        if reddit is None:
+            # praw is only loaded when a real Reddit client is needed
+            import praw
+            # Update fetch workers each get a client of their own, praw.Reddit is not thread-safe
+            client_factory = lambda: praw.Reddit(user_agent = user_agent,
+                                                 client_id = client_id,
+                                                 client_secret = client_secret)
+            reddit = client_factory()
+        self.reddit = reddit
+        self.clock = clock
+        self.subreddits = list(subreddits)
+        # Reddit serves the listings of "a+b+c" as one multireddit
+        self.multireddit = "+".join(self.subreddits)
+        self.fetcher = UpdateFetcher(self.reddit, max_workers = fetch_workers,
+                                     client_factory = client_factory, clock = clock)
         print(f"Reddit instance made in {os.getcwd()}")
 
     # Fix for time offset pending. PRAW returns local time
@@ -19,6 +42,7 @@ class MemeStatsScraper:
         utc_time = datetime.fromtimestamp(unix_time)
         return utc_time.strftime("%Y-%m-%d %H:%M:%S")
 
+    # "time_fetched" is the unix time the meme was formatted at, right after its request
     def __meme_data_formatter(self, meme: GeneratorType):
         return {"id": meme.id,
                 "title": meme.title,
@@ -26,67 +50,70 @@ class MemeStatsScraper:
                 "num_comments": meme.num_comments,
                 "time_created": self.__unix_to_utc_string(meme.created),
                 "meme_url": meme.url,
-                "post_url": f"reddit.com{meme.permalink}"
+                "post_url": f"reddit.com{meme.permalink}",
+                "time_fetched": self.clock()
         }
 
     def __meme_data_compiler(self, memes: GeneratorType):
         return [self.__meme_data_formatter(meme) for meme in memes]
-    
-    def __find_stickied_id(self):
-        stickied_id = ""
-        try:
-            stickied_id = self.reddit.subreddit("memes").sticky(1).id
-            stickied_id = self.reddit.subreddit("memes").sticky(2).id
-        except NotFound:
-            pass
-        except PrawcoreException as e:
-            logging.warning(f"Error: {e}")
-            logging.warning("Request from PRAW failed. Please check your connection.")
-            return
-        return stickied_id
 
-    def find_hot(self, top: int):
-        params = {}
-        stickied_id = self.__find_stickied_id()
-        if stickied_id:
-            params["after"] = f"t3_{stickied_id}"
+    # Latest rate limits of all of this scraper's clients, like praw's reddit.auth.limits
+    def rate_limits(self):
+        return self.fetcher.limits()
+    
+    # Stickied posts are pinned to the top of hot and recognized by their "stickied" attribute
+    # They are filtered out of every listing, paging past a remembered sticky would skip every
+    # post ranked above it once that post is unstickied
+    # Room is made for them only within one page, a full page of hot ("top" = 100, the collector's
+    # default) may return up to MAX_STICKIED_POSTS fewer memes rather than cost a second request
+    # Hot is ranked per subreddit, so a merged listing would not give each subreddit's top memes
+    @REGISTRY.timed("reddit_request_seconds", call = "find_hot")
+    def find_hot(self, top: int, subreddit: str = None):
+        subreddit = subreddit or self.subreddits[0]
         try:
-            memes = self.reddit.subreddit("memes").hot(limit = top, params = params)
-            results = self.__meme_data_compiler(memes)
-            return results
-        except PrawcoreException as e:
+            memes = self.reddit.subreddit(subreddit).hot(limit = min(top + MAX_STICKIED_POSTS, LISTING_PAGE_SIZE))
+            results = self.__meme_data_compiler(meme for meme in memes if not meme.stickied)
+            return results[:top]
+        except request_errors() as e:
             logging.warning(f"Error: {e}")
             logging.warning("Request from PRAW failed. Please check your connection.")
             return
 
+    @REGISTRY.timed("reddit_request_seconds", call = "find_new")
     def find_new(self, before: str = None):
         if before:
-            memes = self.reddit.subreddit("memes").new(params = {"before" : f"t3_{before}"})  
+            memes = self.reddit.subreddit(self.multireddit).new(params = {"before" : f"t3_{before}"})  
         else:
-            memes = self.reddit.subreddit("memes").new(limit = 10)
+            memes = self.reddit.subreddit(self.multireddit).new(limit = 10)
         try:
             results = self.__meme_data_compiler(memes)
             return results
-        except PrawcoreException as e:
+        except request_errors() as e:
             logging.warning(f"Error: {e}")
             logging.warning("Request from PRAW failed. Please check your connection.")
             return
 
     def find_multi_specific(self, meme_ids: Union[str, Iterable[str]]):
-        memes = self.reddit.info([f"t3_{meme_id}" for meme_id in meme_ids])
-        try:
-            results = self.__meme_data_compiler(memes)
-            return results
-        except PrawcoreException as e:
-            logging.warning(f"Error: {e}")
-            logging.warning("Request from PRAW failed. Please check your connection.")
-            return
+        results = []
+        for _, memes in self.iter_multi_specific(meme_ids):
+            if memes is None or memes is DEFERRED:
+                return
+            results.extend(memes)
+        return results
 
-    def is_removed(self, meme_id: str):
-        meme = self.reddit.submission(meme_id)
+    # Streams (chunk_ids, results) per 100-id chunk as they are fetched, results is None on failure
+    # and DEFERRED when the rate limit budget ran out before the chunk was requested
+    # info looks up fullnames from any subreddit, so chunks are shared between subreddits
+    def iter_multi_specific(self, meme_ids: Union[str, Iterable[str]]):
+        return self.fetcher.fetch(meme_ids, self.__meme_data_formatter)
+
+    # Removal status of several memes with one info request: {meme_id: removed_by_category}
+    @REGISTRY.timed("reddit_request_seconds", call = "find_removed")
+    def find_removed(self, meme_ids: Iterable[str]):
+        memes = self.reddit.info([f"t3_{meme_id}" for meme_id in meme_ids])
         try:
-            return meme.removed_by_category
-        except PrawcoreException as e:
+            return {meme.id: meme.removed_by_category for meme in memes}
+        except request_errors() as e:
             logging.warning(f"Error: {e}")
             logging.warning("Request from PRAW failed. Please check your connection.")
             return
\ No newline at end of file
@@ -0,0 +1,107 @@
+# Sharded collection: N collector processes, each with its own Reddit credentials,
+# split the tracked memes between them through a shared collector_workers table.
+# Every worker heartbeats into the table; a meme belongs to the live worker with the
+# highest rendezvous hash for it, so when a worker dies only its memes move to the others.
+# The live worker with the lowest id is the leader and collects new memes for everyone.
+
+import hashlib
+import logging
+import multiprocessing
+import threading
+import time
+from typing import Callable
+import queries
+from config import USER_PARAMS
+from database import DatabaseHelper
+
+# Seconds without a heartbeat after which a worker is considered dead, three missed heartbeats
+DEFAULT_HEARTBEAT_INTERVAL = 60
+DEFAULT_HEARTBEAT_TTL = 180
+
+class ShardCoordinator:
+
+    def __init__(self, dbhelper: DatabaseHelper, worker_id: str,
+                 heartbeat_ttl: float = DEFAULT_HEARTBEAT_TTL, clock: Callable = time.time):
+        self.dbhelper = dbhelper
+        self.worker_id = worker_id
+        self.heartbeat_ttl = heartbeat_ttl
+        self.clock = clock
+        self.live_workers = [worker_id]
+        self.stopped = threading.Event()
+
+    def prepare(self):
+        self.dbhelper.execute_query(queries.COLLECTOR_WORKERS_CREATION_QUERY, mode = "create")
+
+    def heartbeat(self):
+        query = self.dbhelper.backend.upsert_query("collector_workers", ("worker_id", "last_heartbeat"),
+                                                   ("worker_id",), ("last_heartbeat",))
+        self.dbhelper.execute_query(query, params = (self.worker_id, self.clock()))
+
+    # Heartbeats from a thread of its own: the scheduler thread can be blocked for longer than
+    # the TTL by a long update tick, and other workers would then take over this worker's memes
+    def start_heartbeat(self, interval: float = DEFAULT_HEARTBEAT_INTERVAL):
+        def beat():
+            while not self.stopped.wait(interval):
+                try:
+                    self.heartbeat()
+                except Exception:
+                    logging.exception("Heartbeat failed")
+        self.stopped.clear()
+        threading.Thread(target = beat, name = "heartbeat", daemon = True).start()
+
+    def stop_heartbeat(self):
+        self.stopped.set()
+
+    # Re-reads which workers are alive, this worker always counts itself as alive
+    def refresh(self):
+        results = self.dbhelper.execute_query(queries.LIVE_WORKERS_QUERY, mode = "search",
+                                              params = (self.clock() - self.heartbeat_ttl,))
+        workers = {result[0] for result in results or []}
+        workers.add(self.worker_id)
+        if sorted(workers) != self.live_workers:
+            logging.info(f"Live collector workers: {', '.join(sorted(workers))}")
+        self.live_workers = sorted(workers)
+        return self.live_workers
+
+    @property
+    def is_leader(self):
+        return self.live_workers[0] == self.worker_id
+
+    def owner(self, meme_id: str):
+        return max(self.live_workers,
+                   key = lambda worker_id: hashlib.md5(f"{worker_id}:{meme_id}".encode()).digest())
+
+    def owns(self, meme_id: str):
+        return self.owner(meme_id) == self.worker_id
+
+# Reddit credentials of shard "index", from USER_PARAMS["reddit-shards"] if configured
+def shard_credentials(index: int):
+    shards = USER_PARAMS.get("reddit-shards") or [USER_PARAMS["reddit"]]
+    return shards[index % len(shards)]
+
+# Entry point of one worker process
+def run_shard(index: int, database_name: str, collect_new_hours: int, update_hours: int,
+              failsafe: bool = False):
+    from collector import DataCollector, configure_logging
+    from scraper import MemeStatsScraper
+    configure_logging(f"worklog-{index:03d}.log")
+    credentials = shard_credentials(index)
+    scraper = MemeStatsScraper(credentials["USER-AGENT"], credentials["CLIENT-ID"], credentials["CLIENT-SECRET"],
+                               subreddits = USER_PARAMS.get("collection", {}).get("SUBREDDITS") or ["memes"])
+    collector = DataCollector(scraper = scraper, shard_id = f"worker-{index:03d}")
+    collector.prepare_database(database_name)
+    collector.run(collect_new_hours, update_hours, failsafe)
+
+# Starts "num_shards" worker processes and waits for them
+# A worker that dies is not restarted, the remaining workers take over its memes
+def launch_shards(num_shards: int, database_name: str, collect_new_hours: int, update_hours: int,
+                  failsafe: bool = False):
+    processes = [multiprocessing.Process(target = run_shard, name = f"worker-{index:03d}",
+                                         args = (index, database_name, collect_new_hours, update_hours, failsafe))
+                 for index in range(num_shards)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+        if process.exitcode:
+            logging.warning(f"{process.name} exited with code {process.exitcode}, its memes were taken over by the other workers")
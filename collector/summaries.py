@@ -0,0 +1,86 @@
+# Rollup tables kept current as rows are written, so dashboards read one row per meme or per hour
+# instead of grouping over meme_score, meme_comments and meme_status
+# Every flush summarizes its own rows in memory and merges the result into the rollups
+# in the same transaction, so the rollups never disagree with the raw tables
+
+import itertools
+
+# A meme's score, comments and status rows may be split across two flushes,
+# so each part of meme_summary carries its own hour and merges on its own
+MEME_SUMMARY_COLUMNS = ("meme_id", "latest_hour", "latest_score", "peak_score", "peak_hour",
+                        "comments_hour", "latest_comments", "first_hot_hour")
+
+# Columns left NULL by a flush keep their stored value
+# Expressions come before the columns they compare with, see StorageBackend.upsert_query
+MEME_SUMMARY_MERGE = {
+    "latest_score": "CASE WHEN latest_hour IS NULL OR {latest_hour} >= latest_hour THEN {latest_score} ELSE latest_score END",
+    "latest_hour": "CASE WHEN latest_hour IS NULL OR {latest_hour} >= latest_hour THEN {latest_hour} ELSE latest_hour END",
+    "peak_hour": "CASE WHEN peak_score IS NULL OR {peak_score} > peak_score THEN {peak_hour} ELSE peak_hour END",
+    "peak_score": "CASE WHEN peak_score IS NULL OR {peak_score} > peak_score THEN {peak_score} ELSE peak_score END",
+    "latest_comments": "CASE WHEN comments_hour IS NULL OR {comments_hour} >= comments_hour THEN {latest_comments} ELSE latest_comments END",
+    "comments_hour": "CASE WHEN comments_hour IS NULL OR {comments_hour} >= comments_hour THEN {comments_hour} ELSE comments_hour END",
+    "first_hot_hour": "CASE WHEN first_hot_hour IS NULL OR {first_hot_hour} < first_hot_hour THEN {first_hot_hour} ELSE first_hot_hour END",
+}
+
+HOURLY_SUMMARY_COLUMNS = ("hours_elapsed", "num_memes", "total_score", "total_comments", "num_hot")
+
+HOURLY_SUMMARY_MERGE = {column: f"{column} + {{{column}}}" for column in HOURLY_SUMMARY_COLUMNS[1:]}
+
+# Raw tables the rollups are computed from
+SOURCE_TABLES = ("meme_score", "meme_comments", "meme_status", "meme_snapshot")
+
+SUMMARY_TABLES = {
+    "meme_summary": (MEME_SUMMARY_COLUMNS, ("meme_id",), MEME_SUMMARY_MERGE),
+    "hourly_summary": (HOURLY_SUMMARY_COLUMNS, ("hours_elapsed",), HOURLY_SUMMARY_MERGE),
+}
+
+# Summarizes the rows of one flush ({table_name: [row, ...]}) into rows of each rollup table
+def summarize(pending: dict):
+    memes = dict()
+    hours = dict()
+
+    def meme(meme_id: str):
+        if meme_id not in memes:
+            memes[meme_id] = dict.fromkeys(MEME_SUMMARY_COLUMNS[1:])
+        return memes[meme_id]
+
+    def hour(hours_elapsed: int):
+        if hours_elapsed not in hours:
+            hours[hours_elapsed] = dict.fromkeys(HOURLY_SUMMARY_COLUMNS[1:], 0)
+        return hours[hours_elapsed]
+
+    snapshots = pending.get("meme_snapshot", ())
+    score_rows = itertools.chain(pending.get("meme_score", ()), (row[:3] for row in snapshots))
+    comments_rows = itertools.chain(pending.get("meme_comments", ()), (row[:2] + row[3:4] for row in snapshots))
+    status_rows = itertools.chain(pending.get("meme_status", ()), (row[:2] + row[4:] for row in snapshots))
+
+    for meme_id, hours_elapsed, score in score_rows:
+        summary = meme(meme_id)
+        if summary["latest_hour"] is None or hours_elapsed >= summary["latest_hour"]:
+            summary["latest_hour"], summary["latest_score"] = hours_elapsed, score
+        if summary["peak_score"] is None or score > summary["peak_score"] or (
+                score == summary["peak_score"] and hours_elapsed < summary["peak_hour"]):
+            summary["peak_score"], summary["peak_hour"] = score, hours_elapsed
+        totals = hour(hours_elapsed)
+        totals["num_memes"] += 1
+        totals["total_score"] += score
+
+    for meme_id, hours_elapsed, num_comments in comments_rows:
+        summary = meme(meme_id)
+        if summary["comments_hour"] is None or hours_elapsed >= summary["comments_hour"]:
+            summary["comments_hour"], summary["latest_comments"] = hours_elapsed, num_comments
+        hour(hours_elapsed)["total_comments"] += num_comments
+
+    for meme_id, hours_elapsed, is_hot in status_rows:
+        if is_hot:
+            summary = meme(meme_id)
+            if summary["first_hot_hour"] is None or hours_elapsed < summary["first_hot_hour"]:
+                summary["first_hot_hour"] = hours_elapsed
+            hour(hours_elapsed)["num_hot"] += 1
+        else:
+            hour(hours_elapsed)
+
+    return {
+        "meme_summary": [(meme_id, *summary.values()) for meme_id, summary in memes.items()],
+        "hourly_summary": [(hours_elapsed, *totals.values()) for hours_elapsed, totals in hours.items()],
+    }
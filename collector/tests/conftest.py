@@ -0,0 +1,5 @@
+# The collector modules import each other by name, as they do when run from collector/
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,104 @@
+# UpdateFetcher against the fake Reddit's info endpoint (fake_reddit.py)
+import threading
+import time
+from fake_reddit import FakeReddit, RecordedMeme
+from fetcher import UpdateFetcher, DEFERRED
+
+START = 1624600000.0
+
+def make_memes(count: int):
+    memes = []
+    for i in range(count):
+        meme = RecordedMeme(f"m{i:04d}", f"Meme {i}", START - 3600, "", f"/r/memes/comments/m{i:04d}/")
+        meme.scores = [i, i + 1]
+        memes.append(meme)
+    return memes
+
+def fetch_all(fetcher: UpdateFetcher, meme_ids: list):
+    return {tuple(chunk): result for chunk, result in fetcher.fetch(meme_ids, lambda meme: meme.id)}
+
+# Fails if two threads use the client at the same time
+class ExclusiveClient:
+
+    def __init__(self, reddit: FakeReddit):
+        self.reddit = reddit
+        self.auth = reddit.auth
+        self.lock = threading.Lock()
+
+    def info(self, fullnames: list):
+        assert self.lock.acquire(blocking = False), "client used by two workers at once"
+        try:
+            time.sleep(0.01)
+            return list(self.reddit.info(fullnames))
+        finally:
+            self.lock.release()
+
+def test_fetches_every_id_in_chunks_of_100():
+    memes = make_memes(250)
+    reddit = FakeReddit(memes, lambda: START)
+    fetcher = UpdateFetcher(reddit, max_workers = 4, client_factory = lambda: reddit, clock = lambda: START)
+    results = fetch_all(fetcher, [meme.id for meme in memes])
+
+    assert sorted(len(chunk) for chunk in results) == [50, 100, 100]
+    assert sorted(meme_id for chunk in results.values() for meme_id in chunk) == [meme.id for meme in memes]
+    assert reddit.total_requests == 3
+
+def test_workers_never_share_a_client():
+    memes = make_memes(800)
+    reddit = FakeReddit(memes, lambda: START)
+    clients = []
+    def client_factory():
+        clients.append(ExclusiveClient(reddit))
+        return clients[-1]
+    fetcher = UpdateFetcher(ExclusiveClient(reddit), max_workers = 4, client_factory = client_factory,
+                            clock = lambda: START)
+
+    for _ in range(2):
+        results = fetch_all(fetcher, [meme.id for meme in memes])
+        assert all(result is not None for result in results.values())
+    # Clients are kept between fetches
+    assert 1 <= len(clients) <= 3
+
+def test_without_factory_fetches_one_chunk_at_a_time():
+    memes = make_memes(300)
+    reddit = FakeReddit(memes, lambda: START)
+    fetcher = UpdateFetcher(ExclusiveClient(reddit), max_workers = 4, clock = lambda: START)
+
+    results = fetch_all(fetcher, [meme.id for meme in memes])
+    assert fetcher.max_workers == 1
+    assert all(result is not None for result in results.values())
+
+def test_defers_chunks_past_the_budget_on_the_injected_clock():
+    memes = make_memes(500)
+    # The clock is far from the wall clock, as in the benchmark
+    reddit = FakeReddit(memes, lambda: START, requests_per_window = 12, window_seconds = 600)
+    fetcher = UpdateFetcher(reddit, reserve_requests = 10, clock = lambda: START)
+
+    results = fetch_all(fetcher, [meme.id for meme in memes])
+    fetched = [chunk for chunk, result in results.items() if result is not DEFERRED]
+    deferred = [chunk for chunk, result in results.items() if result is DEFERRED]
+    assert len(fetched) == 2
+    assert len(deferred) == 3
+    assert reddit.total_requests == 2
+    assert fetcher.reset_timestamp() == START - START % 600 + 600
+
+def test_budget_is_available_again_after_the_reset():
+    now = [START]
+    memes = make_memes(300)
+    reddit = FakeReddit(memes, lambda: now[0], requests_per_window = 11, window_seconds = 600)
+    fetcher = UpdateFetcher(reddit, reserve_requests = 10, clock = lambda: now[0])
+
+    assert sum(result is DEFERRED for result in fetch_all(fetcher, [meme.id for meme in memes]).values()) == 2
+    now[0] = fetcher.reset_timestamp()
+    assert fetcher.reset_timestamp() is None
+    assert sum(result is DEFERRED for result in fetch_all(fetcher, [meme.id for meme in memes]).values()) == 2
+
+def test_limits_of_a_reset_window_are_unknown():
+    memes = make_memes(10)
+    reddit = FakeReddit(memes, lambda: START)
+    # praw keeps the last response's limits after the window resets
+    reddit.auth = type("Auth", (), {"limits": {"used": 595, "remaining": 5, "reset_timestamp": START - 1}})()
+    fetcher = UpdateFetcher(reddit, clock = lambda: START)
+
+    assert fetcher.limits() == {"used": None, "remaining": None, "reset_timestamp": None}
+    assert fetcher.reset_timestamp() is None
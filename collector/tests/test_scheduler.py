@@ -0,0 +1,135 @@
+import math
+from collections import Counter
+from scheduler import AdaptiveScheduler, MIN_DEFERRAL_SECONDS, PRIORITY_HOT, PRIORITY_NEW
+
+class ManualClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += seconds
+
+def test_late_task_skips_missed_runs():
+    clock = ManualClock()
+    scheduler = AdaptiveScheduler(clock = clock.time, sleep = clock.sleep)
+    runs = []
+    def task():
+        runs.append(clock.now)
+        # The second run blocks for three and a half intervals
+        if len(runs) == 2:
+            clock.now += 35
+    scheduler.schedule(task, interval = 10, until = 100)
+    scheduler.run()
+
+    assert runs == [0, 10, 50, 60, 70, 80, 90, 100]
+
+def test_sleeps_until_the_next_task_is_due():
+    clock = ManualClock()
+    scheduler = AdaptiveScheduler(clock = clock.time, sleep = clock.sleep)
+    runs = []
+    scheduler.schedule(lambda: runs.append(("late", clock.now)), start = 50)
+    scheduler.schedule(lambda: runs.append(("early", clock.now)), start = 20)
+    scheduler.run()
+
+    assert runs == [("early", 20), ("late", 50)]
+
+def test_spaces_tasks_over_the_rest_of_the_window():
+    clock = ManualClock()
+    limits = {"used": 590, "remaining": 10, "reset_timestamp": 100}
+    scheduler = AdaptiveScheduler(rate_limits = lambda: limits, low_quota = 0, clock = clock.time, sleep = clock.sleep)
+    runs = []
+    def task():
+        runs.append(clock.now)
+        limits.update(used = limits["used"] + 1, remaining = limits["remaining"] - 1)
+    scheduler.schedule(task, interval = 1, until = 30)
+    scheduler.run()
+
+    # Due every second, but held to the remaining requests spread over the rest of the window:
+    # when the second run comes due at 1, 9 requests are left for 99 seconds
+    assert runs == [0, 11, 22, 33]
+
+def test_defers_hot_and_new_tasks_until_the_reset_when_quota_is_low():
+    clock = ManualClock()
+    limits = {"used": 595, "remaining": 5, "reset_timestamp": 120}
+    scheduler = AdaptiveScheduler(rate_limits = lambda: limits, low_quota = 50, clock = clock.time, sleep = clock.sleep)
+    runs = []
+    def reset_window():
+        runs.append(("update", clock.now))
+        limits.update(used = 0, remaining = 600, reset_timestamp = 720)
+    scheduler.schedule(lambda: runs.append(("hot", clock.now)), priority = PRIORITY_HOT)
+    scheduler.schedule(reset_window, start = 110)
+    scheduler.schedule(lambda: runs.append(("new", clock.now)), priority = PRIORITY_NEW)
+    scheduler.run()
+
+    # The new window's 600 requests are paced one per second
+    assert runs == [("update", 110), ("hot", 120), ("new", 121)]
+
+def test_stale_limits_after_a_reset_do_not_defer():
+    clock = ManualClock()
+    clock.now = 700
+    # praw keeps the previous window's limits until the next response
+    limits = {"used": 595, "remaining": 5, "reset_timestamp": 600}
+    scheduler = AdaptiveScheduler(rate_limits = lambda: limits, low_quota = 50, clock = clock.time, sleep = clock.sleep)
+    runs = []
+    scheduler.schedule(lambda: runs.append(clock.now), priority = PRIORITY_HOT)
+    iterations = 0
+    while scheduler.run_next():
+        iterations += 1
+
+    assert runs == [700]
+    assert iterations == 1
+
+def test_deferral_never_lands_at_now():
+    clock = ManualClock()
+    # The window resets in a fraction of a second, but not before the check
+    limits = {"used": 595, "remaining": 5, "reset_timestamp": 0.001}
+    scheduler = AdaptiveScheduler(rate_limits = lambda: limits, low_quota = 50, clock = clock.time, sleep = clock.sleep)
+    runs = []
+    scheduler.schedule(lambda: runs.append(clock.now), priority = PRIORITY_HOT)
+    scheduler.run()
+
+    assert runs == [MIN_DEFERRAL_SECONDS]
+
+# Rate limits as praw reports them: every response sets reset_timestamp to its own time
+# plus Reddit's whole seconds until the reset, so the value drifts within a window
+class PrawStyleLimits:
+
+    def __init__(self, clock: ManualClock, requests_per_window: int = 600, window_seconds: int = 600):
+        self.clock = clock
+        self.requests_per_window = requests_per_window
+        self.window_seconds = window_seconds
+        self.window_end = window_seconds
+        self.limits = {"used": 0, "remaining": requests_per_window, "reset_timestamp": window_seconds}
+        # Requests of each group in each window
+        self.usage = Counter()
+
+    def request(self, group: str):
+        now = self.clock.now
+        if now >= self.window_end:
+            self.window_end += self.window_seconds
+            self.limits["used"] = 0
+        used = self.limits["used"] + 1
+        self.limits.update(used = used, remaining = self.requests_per_window - used,
+                           reset_timestamp = now + math.ceil(self.window_end - now))
+        self.usage[group, self.window_end] += 1
+        self.clock.now += 0.3
+
+def test_fair_share_holds_back_a_large_group_under_drifting_resets():
+    clock = ManualClock()
+    reddit = PrawStyleLimits(clock)
+    scheduler = AdaptiveScheduler(rate_limits = lambda: reddit.limits, low_quota = 0,
+                                  clock = clock.time, sleep = clock.sleep)
+    def task(group: str, num_requests: int):
+        for _ in range(num_requests):
+            reddit.request(group)
+    scheduler.schedule(task, "large", 40, interval = 20, until = 599, priority = PRIORITY_HOT, group = "large")
+    scheduler.schedule(task, "small", 1, interval = 20, until = 599, priority = PRIORITY_HOT, group = "small")
+    scheduler.run()
+
+    # The large group stops once it used its half of the first window, the small group keeps running
+    assert 300 <= reddit.usage["large", 600] < 300 + 40
+    assert reddit.usage["small", 600] == 30
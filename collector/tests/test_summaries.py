@@ -0,0 +1,43 @@
+# Rollups kept current by flush (summaries.py) against the backfill queries over the raw tables
+import random
+import pytest
+import queries
+from backends import SQLiteBackend
+from database import DatabaseHelper
+
+def make_helper(directory: str, schema: str):
+    # Small batches, so a meme's updates and their hours are split across many flushes
+    helper = DatabaseHelper(batch_size = 7, backend = SQLiteBackend(directory), schema = schema)
+    helper.connect_server()
+    helper.create_database("memes", connect = True)
+    helper.create_tables()
+    return helper
+
+def rollups(helper: DatabaseHelper, meme_ids: list):
+    return ({meme_id: helper.search_meme_summary(meme_id) for meme_id in meme_ids},
+            helper.search_hourly_summary())
+
+@pytest.mark.parametrize("schema", ["tables", "snapshot"])
+def test_incremental_rollups_match_the_backfill(tmp_path, schema):
+    helper = make_helper(str(tmp_path), schema)
+    rng = random.Random(0)
+    meme_ids = [f"m{i:02d}" for i in range(12)]
+    for meme_id in meme_ids:
+        helper.insert_meme_info(meme_id, meme_id, "2021-06-25 06:00:00", False, "", "", buffered = True)
+    for hours_elapsed in range(6):
+        for meme_id in meme_ids:
+            # Some memes miss an hour, as they do when a tick is deferred
+            if rng.random() < 0.2:
+                continue
+            helper.insert_meme_snapshot(meme_id, hours_elapsed, rng.randint(0, 50), rng.randint(0, 9),
+                                        rng.random() < 0.3, buffered = True)
+    helper.flush()
+    incremental = rollups(helper, meme_ids)
+
+    helper.execute_query("DELETE FROM meme_summary;")
+    helper.execute_query("DELETE FROM hourly_summary;")
+    helper.execute_query(queries.MEME_SUMMARY_BACKFILL_QUERY)
+    helper.execute_query(queries.HOURLY_SUMMARY_BACKFILL_QUERY)
+
+    assert incremental[1]
+    assert incremental == rollups(helper, meme_ids)